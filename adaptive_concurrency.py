@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from metrics import REGISTRY, API_RETRIES
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight page requests, tuned from observed throughput.
+
+    Completed pages are grouped into windows of a few seconds of busy time,
+    stretches with no request in flight don't count. At the end of each
+    window the limit is cut multiplicatively when pages failed or the
+    node pushed back (429s, 5xx, truncated pages all show up as at-home
+    retries), grows by one while throughput keeps rising or latency stays
+    near its best, and shrinks by one when throughput fell or requests only
+    queue up for longer. Windows in which
+    the limit was never reached say nothing about capacity and leave it
+    alone.
+
+    With data_saver_below set (bytes/s), pages are fetched from dataSaver
+    while measured bandwidth stays under that threshold, and from data again
+    once it recovers to twice the threshold.
+
+    Page requests are coroutines on the API event loop, slot() waits there
+    without holding a thread. The lock only guards the counters read by
+    other threads (status text, metrics, the settings dialog).
+    """
+
+    def __init__(self, initial=6, minimum=1, maximum=24, window=2.0, decrease_factor=0.7,
+                 latency_tolerance=1.5, data_saver_below=None):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.window = window
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.data_saver_below = data_saver_below
+
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        # Futures of coroutines waiting for a free slot, touched on the event loop only
+        self.waiters = deque()
+        # When the last request finished, idle time is left out of the window
+        self.idle_since = None
+
+        # Best throughput and page latency seen so far, both drift so a changed link is relearned
+        self.best_rate = 0.0
+        self.best_latency = None
+        self.rate = None
+        self.data_saver = False
+
+        self.retries_seen = self._node_retries()
+        self._reset_window(time.monotonic())
+
+        REGISTRY.register_collector('concurrency', self._collect_metrics)
+
+    @property
+    def adaptive(self):
+        return self.minimum < self.maximum
+
+    @property
+    def current(self):
+        """Whole number of requests allowed in flight right now"""
+        return int(self.limit)
+
+    def _collect_metrics(self):
+        return {
+            'page_concurrency_limit': self.current,
+            'page_requests_in_flight': self.in_flight,
+            'page_throughput_bytes_per_second': round(self.rate or 0.0, 1),
+            'data_saver_active': int(self.data_saver)
+        }
+
+    @staticmethod
+    def _node_retries():
+        return API_RETRIES.total(endpoint='at-home')
+
+    def _reset_window(self, now):
+        self.window_started = now
+        self.window_bytes = 0
+        self.window_pages = 0
+        self.window_failures = 0
+        self.window_latency = 0.0
+        self.window_saturated = False
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one in-flight request, waiting while the limit is reached"""
+        while self.in_flight >= self.current:
+            self.window_saturated = True
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                elif not waiter.cancelled():
+                    # Woken just before being cancelled, pass the free slot on
+                    self._wake(1)
+                raise
+
+        with self.lock:
+            if self.idle_since is not None:
+                # Nothing was downloading (e.g. between chapters), that gap says nothing about the link
+                self.window_started += time.monotonic() - self.idle_since
+                self.idle_since = None
+            self.in_flight += 1
+            if self.in_flight >= self.current:
+                self.window_saturated = True
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                if not self.in_flight:
+                    self.idle_since = time.monotonic()
+            self._wake(1)
+
+    def _wake(self, count):
+        """Let up to count waiting coroutines retry for a slot"""
+        while count and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                count -= 1
+
+    def record(self, latency, size):
+        """Report one finished page request from the event loop, size is None when it failed"""
+        with self.lock:
+            if size is None:
+                self.window_failures += 1
+            else:
+                self.window_pages += 1
+                self.window_bytes += size
+                self.window_latency += latency
+
+            now = time.monotonic()
+            if now - self.window_started >= self.window and self.window_pages + self.window_failures >= 2:
+                self._end_window(now)
+
+    def _end_window(self, now):
+        """Apply one AIMD step, caller must hold the lock"""
+        rate = self.window_bytes / (now - self.window_started)
+        mean_latency = self.window_latency / self.window_pages if self.window_pages else None
+        retries = self._node_retries()
+        pushed_back = retries > self.retries_seen
+        self.retries_seen = retries
+
+        self.rate = rate if self.rate is None else 0.5 * rate + 0.5 * self.rate
+        if mean_latency is not None:
+            if self.best_latency is None or mean_latency < self.best_latency:
+                self.best_latency = mean_latency
+            else:
+                self.best_latency *= 1.01
+
+        previous = self.limit
+        if self.window_failures or pushed_back:
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        elif self.window_saturated:
+            queueing = mean_latency is not None and mean_latency > self.best_latency * self.latency_tolerance
+            if rate > self.best_rate * 1.05 or (not queueing and rate >= self.best_rate * 0.9):
+                self.limit = min(self.maximum, self.limit + 1)
+            else:
+                # Throughput fell, or requests only wait longer for the same throughput
+                self.limit = max(self.minimum, self.limit - 1)
+
+        if self.window_saturated:
+            self.best_rate = max(rate, self.best_rate * 0.95)
+            if self.data_saver_below:
+                if not self.data_saver and self.rate < self.data_saver_below:
+                    print(f"Bandwidth {self.rate / 1024:.0f} KB/s is low, switching to dataSaver pages")
+                    self.data_saver = True
+                elif self.data_saver and self.rate > self.data_saver_below * 2:
+                    print(f"Bandwidth {self.rate / 1024:.0f} KB/s recovered, switching back to full quality")
+                    self.data_saver = False
+
+        if self.limit > previous:
+            self._wake(int(self.limit) - int(previous))
+        self._reset_window(now)
+
+    def set_data_saver_below(self, threshold):
+        """Change the dataSaver threshold in bytes/s, None turns the policy off"""
+        with self.lock:
+            self.data_saver_below = threshold
+            if not threshold:
+                self.data_saver = False
+
+    def describe(self):
+        return f"{self.current} parallel" + (", dataSaver" if self.data_saver else "")
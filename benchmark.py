@@ -0,0 +1,235 @@
+"""End-to-end download benchmark against a local fake MangaDex.
+
+Runs the fake API and at-home node in a separate process, then drives
+MangaDexAPI (search, feed) and MangaDownloader.download_chapter against it
+and writes the results as JSON, e.g.
+
+    python benchmark.py --chapters 5 --pages 20 --latency 0.05 --label baseline
+    python benchmark.py --chapters 5 --pages 20 --latency 0.05 --compare benchmark_results/baseline-*.json
+"""
+import argparse
+import glob
+import json
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished children, in MB"""
+    if resource is None:
+        return None, None
+    # ru_maxrss is KB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+def cpu_seconds():
+    """CPU time of this process plus its finished children (image pipeline workers)"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def start_fake_server(options):
+    from fake_mangadex import serve
+
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(options, ready), daemon=True)
+    process.start()
+    return process, ready.get(timeout=120)
+
+def run_benchmark(args):
+    from downloader import MangaDownloader
+    from mangadx_api import AsyncMangaDexAPI, MangaDexAPI
+    from metrics import REGISTRY
+
+    options = {
+        'manga_count': args.manga,
+        'chapters_per_manga': args.chapters,
+        'pages_per_chapter': args.pages,
+        'page_width': args.width,
+        'page_height': args.height,
+        'image_format': args.format,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+        'truncate_rate': args.truncate_rate,
+        'api_rate_limit': args.rate_limit,
+        'seed': args.seed
+    }
+    server, info = start_fake_server(options)
+    work_dir = tempfile.mkdtemp(prefix="mangadex-bench-")
+    # History and staging files land in the scratch folder, not the user's history.db
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+
+    try:
+        # No disk cache or chapter store, every run starts cold
+        client = AsyncMangaDexAPI(info['api_url'], cache=False, chapter_store=False)
+        api = MangaDexAPI(client=client)
+        downloader = MangaDownloader(api, max_workers=args.workers, global_max_workers=args.max_concurrency,
+                                     output_format=args.output_format, adaptive_concurrency=not args.fixed,
+                                     data_saver_below=args.data_saver_below)
+
+        started = time.perf_counter()
+        manga = api.search_manga("benchmark")
+        search_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        chapters = api.get_manga_chapters(manga[0]['id'])
+        feed_seconds = time.perf_counter() - started
+
+        cpu_before = cpu_seconds()
+        chapter_seconds = []
+        failures = 0
+        pages = 0
+        bytes_written = 0
+        download_started = time.perf_counter()
+
+        for chapter in chapters[:args.chapters]:
+            save_path = os.path.join(work_dir, chapter['id'])
+            os.makedirs(save_path)
+            started = time.perf_counter()
+            try:
+                path = downloader.download_chapter(chapter, "Benchmark", save_path)
+            except Exception as e:
+                print(f"Chapter {chapter['attributes']['chapter']} failed: {e}")
+                failures += 1
+                continue
+            chapter_seconds.append(time.perf_counter() - started)
+            pages += chapter['attributes']['pages']
+            bytes_written += os.path.getsize(path)
+
+        download_seconds = time.perf_counter() - download_started
+
+        # Join the pool workers so their CPU time and memory are accounted for
+        downloader.image_pipeline.shutdown(wait=True)
+        cpu_used = cpu_seconds() - cpu_before
+        final_concurrency = downloader.concurrency.current
+        rss_self, rss_children = peak_rss_mb()
+        api.close()
+    finally:
+        os.chdir(previous_dir)
+        server.terminate()
+        server.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'label': args.label,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'config': dict(options, workers=args.workers, max_concurrency=args.max_concurrency,
+                       adaptive=not args.fixed, data_saver_below=args.data_saver_below,
+                       output_format=args.output_format, chapters_downloaded=args.chapters),
+        'results': {
+            'search_seconds': round(search_seconds, 4),
+            'feed_seconds': round(feed_seconds, 4),
+            'chapters_ok': len(chapter_seconds),
+            'chapters_failed': failures,
+            'pages': pages,
+            'download_seconds': round(download_seconds, 4),
+            'pages_per_second': round(pages / download_seconds, 2) if download_seconds else None,
+            'output_mb_per_second': round(bytes_written / 1048576 / download_seconds, 2) if download_seconds else None,
+            'chapter_p50_seconds': round(percentile(chapter_seconds, 0.5), 4) if chapter_seconds else None,
+            'chapter_p99_seconds': round(percentile(chapter_seconds, 0.99), 4) if chapter_seconds else None,
+            'chapter_mean_seconds': round(statistics.mean(chapter_seconds), 4) if chapter_seconds else None,
+            'cpu_ms_per_page': round(cpu_used * 1000 / pages, 2) if pages else None,
+            'final_concurrency': final_concurrency,
+            'peak_rss_mb': rss_self,
+            'peak_rss_children_mb': rss_children
+        },
+        'metrics': REGISTRY.to_dict()
+    }
+
+# Numbers compared against a baseline, and whether higher is better
+COMPARED = (
+    ('pages_per_second', True),
+    ('output_mb_per_second', True),
+    ('chapter_p50_seconds', False),
+    ('chapter_p99_seconds', False),
+    ('cpu_ms_per_page', False),
+    ('peak_rss_mb', False),
+)
+
+def compare(result, baseline):
+    """Print how each headline number moved against a baseline run"""
+    print(f"\nCompared with {baseline.get('label') or 'baseline'} ({baseline.get('timestamp')}):")
+    for key, higher_is_better in COMPARED:
+        new, old = result['results'].get(key), baseline.get('results', {}).get(key)
+        if new is None or not old:
+            continue
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        verdict = "better" if better else ("worse" if change else "same")
+        print(f"  {key:24} {old:>10} -> {new:>10}  ({change:+.1f}%, {verdict})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the downloader against a local fake MangaDex")
+    parser.add_argument('--label', default='run', help="Name stored with the results")
+    parser.add_argument('--manga', type=int, default=5, help="Manga the fake API lists")
+    parser.add_argument('--chapters', type=int, default=5, help="Chapters to download")
+    parser.add_argument('--pages', type=int, default=20, help="Pages per chapter")
+    parser.add_argument('--width', type=int, default=1000)
+    parser.add_argument('--height', type=int, default=1400)
+    parser.add_argument('--format', choices=('jpeg', 'png', 'webp'), default='jpeg', help="Page image format")
+    parser.add_argument('--output-format', choices=('pdf', 'cbz'), default='pdf')
+    parser.add_argument('--workers', type=int, default=6, help="Concurrent page downloads to start from")
+    parser.add_argument('--max-concurrency', type=int, default=24, help="Ceiling for concurrent page downloads")
+    parser.add_argument('--fixed', action='store_true', help="Keep concurrency at --max-concurrency, no AIMD")
+    parser.add_argument('--data-saver-below', type=float, default=None,
+                        help="Fetch dataSaver pages while bandwidth is under this many bytes/s")
+    parser.add_argument('--latency', type=float, default=0.0, help="Added seconds per request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random extra seconds per request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help="Fraction of pages cut short")
+    parser.add_argument('--rate-limit', type=int, default=None, help="API requests per second before 429s")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Results file, default benchmark_results/<label>-<time>.json")
+    parser.add_argument('--compare', help="Earlier results file (glob allowed, newest match is used)")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+
+    output = args.output or os.path.join(
+        "benchmark_results", f"{args.label}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+    print(json.dumps(result['results'], indent=2))
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        matches = sorted(glob.glob(args.compare), key=os.path.getmtime)
+        matches = [match for match in matches if os.path.abspath(match) != os.path.abspath(output)]
+        if matches:
+            with open(matches[-1], 'r', encoding='utf-8') as f:
+                compare(result, json.load(f))
+        else:
+            print(f"No baseline matches {args.compare}")
+
+if __name__ == "__main__":
+    main()
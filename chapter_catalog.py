@@ -0,0 +1,163 @@
+import bisect
+import math
+from utils import parse_chapter_number
+
+def chapter_groups(chapter):
+    """(group id, name) pairs of a chapter, names need includes[]=scanlation_group"""
+    return [(relationship['id'], relationship.get('attributes', {}).get('name'))
+            for relationship in chapter.get('relationships', [])
+            if relationship.get('type') == 'scanlation_group']
+
+class ChapterCatalog:
+    """Indexed view of a manga's chapter feed.
+
+    Chapters are kept in reading order: by number, with unnumbered chapters
+    ("Extra", oneshots) placed after the last numbered chapter of their
+    volume. Indexes by chapter number, language and scanlation group make
+    range queries and picking one release per chapter cheap.
+    """
+
+    def __init__(self, chapters=()):
+        self.by_id = {}
+        self.by_number = {}
+        self.by_language = {}
+        self.by_group = {}
+        self.group_names = {}
+        self.ordered = []
+        self.keys = []
+        self.add(chapters)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        return iter(self.ordered)
+
+    def add(self, chapters):
+        """Index more chapters, a chapter already in the catalog is replaced"""
+        for chapter in chapters:
+            if chapter['id'] in self.by_id:
+                self._unindex(self.by_id[chapter['id']])
+            self._index(chapter)
+        self._sort()
+
+    def _index(self, chapter):
+        attrs = chapter.get('attributes', {})
+        self.by_id[chapter['id']] = chapter
+        self.by_number.setdefault(parse_chapter_number(attrs.get('chapter')), []).append(chapter)
+        self.by_language.setdefault(attrs.get('translatedLanguage'), []).append(chapter)
+        for group_id, name in chapter_groups(chapter):
+            self.by_group.setdefault(group_id, []).append(chapter)
+            if name:
+                self.group_names[group_id] = name
+
+    def _unindex(self, chapter):
+        attrs = chapter.get('attributes', {})
+        self.by_number[parse_chapter_number(attrs.get('chapter'))].remove(chapter)
+        self.by_language[attrs.get('translatedLanguage')].remove(chapter)
+        for group_id, _ in chapter_groups(chapter):
+            self.by_group[group_id].remove(chapter)
+
+    def _sort(self):
+        # Where each volume ends, unnumbered chapters of a volume go right after it
+        volume_ends = {}
+        for number, chapters in self.by_number.items():
+            if number is None:
+                continue
+            for chapter in chapters:
+                volume = chapter.get('attributes', {}).get('volume')
+                volume_ends[volume] = max(volume_ends.get(volume, number), number)
+
+        def sort_key(chapter):
+            attrs = chapter.get('attributes', {})
+            number = parse_chapter_number(attrs.get('chapter'))
+            volume_number = parse_chapter_number(attrs.get('volume'))
+            if number is None:
+                position, extra = volume_ends.get(attrs.get('volume'), math.inf), 1
+            else:
+                position, extra = number, 0
+            return (position, extra, math.inf if volume_number is None else volume_number,
+                    attrs.get('chapter') or '', attrs.get('translatedLanguage') or '', chapter['id'])
+
+        self.ordered = sorted(self.by_id.values(), key=sort_key)
+        self.keys = [sort_key(chapter)[0] for chapter in self.ordered]
+
+    def get(self, chapter_id):
+        return self.by_id.get(chapter_id)
+
+    def languages(self):
+        return sorted(language for language, chapters in self.by_language.items() if language and chapters)
+
+    def groups(self):
+        """Group id -> name of every group with chapters in the catalog"""
+        return {group_id: self.group_names.get(group_id, group_id)
+                for group_id, chapters in self.by_group.items() if chapters}
+
+    def select(self, start=None, end=None, languages=None, groups=None):
+        """Chapters numbered between start and end (inclusive) in reading order.
+
+        Without bounds unnumbered chapters are included too. languages and
+        groups narrow the result down further.
+        """
+        if start is None and end is None:
+            chapters = self.ordered
+        else:
+            low = bisect.bisect_left(self.keys, -math.inf if start is None else start)
+            high = bisect.bisect_right(self.keys, math.inf if end is None else end)
+            chapters = [chapter for chapter in self.ordered[low:high]
+                        if parse_chapter_number(chapter.get('attributes', {}).get('chapter')) is not None]
+
+        if languages:
+            languages = set(languages)
+            chapters = [chapter for chapter in chapters
+                        if chapter.get('attributes', {}).get('translatedLanguage') in languages]
+        if groups:
+            groups = set(groups)
+            chapters = [chapter for chapter in chapters
+                        if groups.intersection(group_id for group_id, _ in chapter_groups(chapter))]
+        return chapters
+
+    def best_releases(self, chapters=None, prefer_groups=(), prefer_languages=None):
+        """Keep one release of each chapter, in reading order.
+
+        Releases of the same chapter number are compared by preferred
+        language, preferred group (ids or names), then whether the pages are
+        hosted on MangaDex, page count and the newest upload. Without
+        prefer_languages every language keeps its own best release.
+        Unnumbered chapters are always kept.
+        """
+        chapters = self.ordered if chapters is None else chapters
+        language_rank = {language: rank for rank, language in enumerate(prefer_languages or ())}
+        group_rank = {group: rank for rank, group in enumerate(prefer_groups)}
+
+        def score(chapter):
+            attrs = chapter.get('attributes', {})
+            ranks = [group_rank[key] for group_id, name in chapter_groups(chapter)
+                     for key in (group_id, name) if key in group_rank]
+            released = attrs.get('readableAt') or attrs.get('publishAt') or ''
+            return (
+                language_rank.get(attrs.get('translatedLanguage'), len(language_rank)),
+                min(ranks, default=len(group_rank)),
+                bool(attrs.get('externalUrl')),
+                -(attrs.get('pages') or 0),
+                # Newest first: invert the ISO timestamp's characters, undated last
+                not released,
+                tuple(-ord(c) for c in released)
+            )
+
+        best = {}
+        for chapter in chapters:
+            attrs = chapter.get('attributes', {})
+            number = parse_chapter_number(attrs.get('chapter'))
+            if number is None:
+                key = chapter['id']
+            elif prefer_languages:
+                key = number
+            else:
+                key = (number, attrs.get('translatedLanguage'))
+
+            if key not in best or score(chapter) < score(best[key]):
+                best[key] = chapter
+
+        kept = {chapter['id'] for chapter in best.values()}
+        return [chapter for chapter in chapters if chapter['id'] in kept]
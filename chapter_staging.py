@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from mangadx_api import page_hash_prefix
+
+class ChapterStaging:
+    """Persistent staging folder for one chapter's pages.
+
+    Pages are written to {save_path}/.staging/{chapter_id}/ as they arrive and
+    recorded under their at-home filename, so an interrupted download only
+    has to fetch what is missing. manifest.json remembers the at-home chapter
+    hash (when the chapter changed upstream the old pages are thrown away);
+    each finished page is appended to manifest.journal, which is folded back
+    into the manifest the next time the chapter is opened. Staged pages are
+    checked against the SHA-256 prefix in their filename before reuse.
+    """
+
+    MANIFEST = "manifest.json"
+    JOURNAL = "manifest.journal"
+
+    def __init__(self, save_path, chapter_id, chapter_hash, filenames):
+        self.directory = os.path.join(save_path, ".staging", chapter_id)
+        self.manifest_path = os.path.join(self.directory, self.MANIFEST)
+        self.journal_path = os.path.join(self.directory, self.JOURNAL)
+        self.chapter_id = chapter_id
+        self.chapter_hash = chapter_hash
+        self.filenames = list(filenames)
+        self.lock = threading.Lock()
+        # Pages whose contents were checked against their filename hash in this run
+        self.verified = set()
+
+        self.pages = self._load()
+        # Start every run from a compact manifest and an empty journal
+        self._save()
+
+    def _load(self):
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                if manifest.get('hash') == self.chapter_hash:
+                    pages = manifest.get('pages', {})
+                    self._replay_journal(pages)
+                    return pages
+                print(f"Chapter {self.chapter_id} changed upstream, discarding staged pages")
+            except Exception as e:
+                print(f"Error reading staging manifest: {e}")
+
+        # Nothing usable, start from an empty folder
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        return {}
+
+    def _replay_journal(self, pages):
+        """Apply the page checkpoints appended since the manifest was written"""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Last line cut short by a crash
+                if record['entry'] is None:
+                    pages.pop(record['page'], None)
+                else:
+                    pages[record['page']] = record['entry']
+
+    def _save(self):
+        """Write the manifest atomically and start a new journal, caller must hold the lock"""
+        manifest = {'chapter_id': self.chapter_id, 'hash': self.chapter_hash, 'pages': self.pages}
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def _journal(self, filename, entry):
+        """Record one page change, caller must hold the lock"""
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'page': filename, 'entry': entry}) + "\n")
+
+    def _drop(self, filename, path):
+        with self.lock:
+            if self.pages.pop(filename, None) is not None:
+                self._journal(filename, None)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _matches_hash(path, expected):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest().startswith(expected)
+
+    def page_path(self, index, data_saver_ok=False):
+        """Path of a staged page, None if it still has to be downloaded.
+
+        dataSaver copies only count when data_saver_ok is set, a full quality
+        download fetches them again.
+        """
+        filename = self.filenames[index]
+        with self.lock:
+            entry = self.pages.get(filename)
+        if not entry:
+            return None
+        # Manifests from before quality was recorded: dataSaver pages have their own file name
+        data_saver = entry.get('quality', 'data' if entry['file'] == filename else 'data-saver') == 'data-saver'
+        if data_saver and not data_saver_ok:
+            return None
+
+        path = os.path.join(self.directory, entry['file'])
+        # A page cut short by a crash doesn't count
+        if not os.path.exists(path) or os.path.getsize(path) != entry['size']:
+            return None
+
+        expected = page_hash_prefix(entry['file'])
+        if expected and entry['file'] not in self.verified:
+            if not self._matches_hash(path, expected):
+                print(f"Staged page {index+1} is corrupt, downloading it again")
+                self._drop(filename, path)
+                return None
+            with self.lock:
+                self.verified.add(entry['file'])
+        return path
+
+    def part_path(self, index, stored_name=None):
+        """Temporary path a page is streamed to before commit_page"""
+        return os.path.join(self.directory, (stored_name or self.filenames[index]) + ".part")
+
+    def commit_page(self, index, stored_name=None, data_saver=False):
+        """Move a fully streamed page into place and checkpoint it in the manifest"""
+        filename = self.filenames[index]
+        stored_name = stored_name or filename
+        path = os.path.join(self.directory, stored_name)
+        os.replace(self.part_path(index, stored_name), path)
+
+        with self.lock:
+            entry = {'file': stored_name, 'size': os.path.getsize(path),
+                     'quality': 'data-saver' if data_saver else 'data'}
+            self.pages[filename] = entry
+            # Streamed pages were already checked against their hash
+            self.verified.add(stored_name)
+            self._journal(filename, entry)
+        return path
+
+    def staged_count(self, data_saver_ok=False):
+        """Pages that will not be downloaded again, counted the way page_path decides"""
+        return sum(1 for index in range(len(self.filenames)) if self.page_path(index, data_saver_ok))
+
+    def cleanup(self):
+        """Remove the staging folder once the chapter file is complete"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        parent = os.path.dirname(self.directory)
+        try:
+            os.rmdir(parent)  # Only succeeds when no other chapter is staged
+        except OSError:
+            pass
@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+class ChapterStore:
+    """Local copy of each manga's chapter feed, one JSON file per manga and language set.
+
+    Each record remembers when it was last synced so the next refresh only
+    asks the API for chapters updated since then.
+    """
+
+    def __init__(self, directory=os.path.join("cache", "chapters")):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, manga_id, languages):
+        language_key = '_'.join(sorted(languages))
+        return os.path.join(self.directory, f"{manga_id}-{language_key}.json")
+
+    def load(self, manga_id, languages):
+        """Return the stored record or None if this feed was never synced"""
+        path = self._path(manga_id, languages)
+        with self.lock:
+            if not os.path.exists(path):
+                return None
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Error loading chapter store {path}: {e}")
+                return None
+
+    def save(self, manga_id, languages, chapters, last_sync):
+        """Replace the stored chapters, chapters is a dict of id -> chapter"""
+        path = self._path(manga_id, languages)
+        record = {
+            'manga_id': manga_id,
+            'languages': sorted(languages),
+            'last_sync': last_sync,
+            'chapters': chapters
+        }
+        with self.lock:
+            temp_path = path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        return record
+
+    def remove(self, manga_id, languages):
+        path = self._path(manga_id, languages)
+        with self.lock:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def timestamp(moment=None):
+        """Format a UTC time the way the feed's updatedAtSince expects it"""
+        moment = moment or datetime.now(timezone.utc)
+        return moment.strftime('%Y-%m-%dT%H:%M:%S')
+
+    @staticmethod
+    def parse(timestamp):
+        return datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+
+    @classmethod
+    def seconds_since(cls, timestamp):
+        return (datetime.now(timezone.utc) - cls.parse(timestamp)).total_seconds()
@@ -0,0 +1,191 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from metrics import REGISTRY
+
+# Thumbnail box in pixels, covers keep their aspect ratio inside it
+THUMBNAIL_SIZE = (40, 56)
+
+def make_thumbnail(image_data, size=THUMBNAIL_SIZE):
+    """Decode a cover and shrink it to fit size, returns PNG bytes Tk can show without PIL"""
+    with Image.open(io.BytesIO(image_data)) as img:
+        # JPEG can decode straight at a fraction of its resolution
+        img.draft('RGB', (size[0] * 2, size[1] * 2))
+        thumbnail = img.convert('RGB')
+    thumbnail.thumbnail(size, Image.LANCZOS)
+
+    output = io.BytesIO()
+    thumbnail.save(output, 'PNG', optimize=True)
+    return output.getvalue()
+
+class CoverThumbnails:
+    """Cover thumbnails for manga lists, cached in memory and on disk.
+
+    request() looks a thumbnail up in the memory LRU, then the disk cache,
+    and only then downloads the small .256.jpg cover. Downloading, decoding
+    and downscaling run on a small thread pool, never on the caller's
+    thread. Finished thumbnails are PNG bytes; both caches are capped in
+    bytes and evict the least recently used entries.
+    """
+
+    def __init__(self, api, directory=os.path.join("cache", "covers"), size=THUMBNAIL_SIZE,
+                 max_disk_bytes=32 * 1024 * 1024, max_memory_bytes=8 * 1024 * 1024, workers=4):
+        self.api = api
+        self.directory = directory
+        self.size = tuple(size)
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'downloads': 0, 'failures': 0, 'evicted': 0}
+
+        # key -> PNG bytes, least recently used first
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+
+        # file name -> size of every thumbnail on disk, least recently used first
+        os.makedirs(directory, exist_ok=True)
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+        self._scan_disk()
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="covers")
+
+        REGISTRY.register_collector('covers', self._collect_metrics)
+
+    def _collect_metrics(self):
+        with self.lock:
+            return dict(
+                {f'cover_{name}_total': value for name, value in self.counters.items()},
+                cover_memory_bytes=self.memory_bytes,
+                cover_disk_bytes=self.disk_bytes
+            )
+
+    def _scan_disk(self):
+        """Rebuild the disk LRU from the files' modification times"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, file_size in sorted(entries):
+            self.disk[name] = file_size
+            self.disk_bytes += file_size
+
+    def key(self, manga_id, cover_file):
+        width, height = self.size
+        return f"{manga_id}-{cover_file}-{width}x{height}.png"
+
+    def cached(self, manga_id, cover_file):
+        """Thumbnail from the memory cache only, cheap enough for the UI thread"""
+        key = self.key(manga_id, cover_file)
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+            return data
+
+    def request(self, manga_id, cover_file, callback):
+        """Load a thumbnail in the background and call callback(png_bytes) on a worker thread.
+
+        callback is not called when the cover could not be loaded. Returns
+        the future, cancelling it drops a request that hasn't started yet.
+        """
+        return self.executor.submit(self._load, manga_id, cover_file, callback)
+
+    def _load(self, manga_id, cover_file, callback):
+        key = self.key(manga_id, cover_file)
+        data = self.cached(manga_id, cover_file)
+        if data is None:
+            data = self._read_disk(key)
+        if data is None:
+            data = self._download(manga_id, cover_file)
+            if data is not None:
+                self._write_disk(key, data)
+        if data is None:
+            return None
+
+        self._remember(key, data)
+        callback(data)
+        return data
+
+    def _download(self, manga_id, cover_file):
+        image_data = self.api.download_cover(manga_id, cover_file)
+        data = None
+        if image_data is not None:
+            try:
+                data = make_thumbnail(image_data, self.size)
+            except Exception as e:
+                print(f"Error decoding cover of {manga_id}: {e}")
+        if data is None:
+            with self.lock:
+                self.counters['failures'] += 1
+            return None
+
+        with self.lock:
+            self.counters['downloads'] += 1
+        return data
+
+    def _remember(self, key, data):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return
+            self.memory[key] = data
+            self.memory_bytes += len(data)
+            while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+
+    def _read_disk(self, key):
+        with self.lock:
+            if key not in self.disk:
+                return None
+            self.disk.move_to_end(key)
+
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # The modification time is the LRU order on the next start
+        except OSError:
+            with self.lock:
+                self.disk_bytes -= self.disk.pop(key, 0)
+            return None
+
+        with self.lock:
+            self.counters['disk_hits'] += 1
+        return data
+
+    def _write_disk(self, key, data):
+        path = os.path.join(self.directory, key)
+        try:
+            temp_path = path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error caching cover: {e}")
+            return
+
+        with self.lock:
+            self.disk_bytes += len(data) - self.disk.pop(key, 0)
+            self.disk[key] = len(data)
+            evicted = []
+            while self.disk_bytes > self.max_disk_bytes and len(self.disk) > 1:
+                name, file_size = self.disk.popitem(last=False)
+                self.disk_bytes -= file_size
+                self.counters['evicted'] += 1
+                evicted.append(name)
+
+        for name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,391 @@
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from chapter_catalog import ChapterCatalog
+from downloader import MangaDownloader, DownloadCancelled
+from mangadx_api import ALL_LANGUAGES
+
+# Job states
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+PAUSED = 'paused'
+DONE = 'done'
+FAILED = 'failed'
+
+class DownloadJob:
+    """One chapter waiting in (or finished by) the download queue"""
+
+    def __init__(self, chapter, manga_title, save_path, manga_id=None, priority=0,
+                 job_id=None, status=QUEUED, progress=0, message="", file_path=None, created_at=None, seq=0,
+                 output_format=None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.chapter = chapter
+        self.manga_title = manga_title
+        self.manga_id = manga_id
+        self.save_path = save_path
+        self.priority = priority
+        self.status = status
+        self.progress = progress
+        self.message = message
+        self.file_path = file_path
+        self.created_at = created_at or datetime.now().isoformat()
+        self.seq = seq
+        # None uses the downloader's default format
+        self.output_format = output_format
+        self.cancel_event = threading.Event()
+
+    @property
+    def chapter_number(self):
+        return self.chapter.get('attributes', {}).get('chapter') or 'Unknown'
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'chapter': self.chapter,
+            'manga_title': self.manga_title,
+            'manga_id': self.manga_id,
+            'save_path': self.save_path,
+            'priority': self.priority,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'file_path': self.file_path,
+            'created_at': self.created_at,
+            'seq': self.seq,
+            'output_format': self.output_format
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(**data)
+        # Anything interrupted by a restart goes back in line
+        if job.status == DOWNLOADING:
+            job.status = QUEUED
+            job.progress = 0
+        return job
+
+def _compact_chapter(chapter):
+    """Keep only what the downloader needs, the queue file stays small"""
+    attrs = chapter.get('attributes', {})
+    return {
+        'id': chapter['id'],
+        'attributes': {
+            key: attrs.get(key)
+            for key in ('chapter', 'volume', 'title', 'translatedLanguage', 'pages')
+        }
+    }
+
+class DownloadQueue:
+    """Persistent multi-chapter download queue.
+
+    Jobs run highest priority first (FIFO within a priority). Several chapters
+    download at once, sized so together they fill the downloader's global
+    page-fetch budget.
+    """
+
+    def __init__(self, downloader=None, queue_file="queue.json", max_active_chapters=None, on_change=None,
+                 progress_bus=None):
+        self.downloader = downloader or MangaDownloader()
+        self.queue_file = queue_file
+        self.on_change = on_change
+        # With a bus, page-level progress is published there under the job id and
+        # on_change only fires for state changes (queued, done, failed, ...)
+        self.progress_bus = progress_bus
+
+        if max_active_chapters is None:
+            max_active_chapters = max(1, self.downloader.global_max_workers // self.downloader.max_workers)
+        self.max_active_chapters = max_active_chapters
+
+        self.jobs = {}
+        # Jobs a worker is still running, even if paused/re-queued meanwhile. A job
+        # is only handed out again once that run has returned, so two downloads
+        # never share one staging folder
+        self.running_jobs = set()
+        self.next_seq = 0
+        self.running = False
+        self.workers = []
+        self.condition = threading.Condition()
+        # Jobs changed under the condition, on_change hears about them once it is released
+        self.pending_changes = []
+
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.queue_file):
+            return
+
+        try:
+            with open(self.queue_file, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except Exception as e:
+            print(f"Error loading download queue: {e}")
+            return
+
+        for data in saved:
+            job = DownloadJob.from_dict(data)
+            self.jobs[job.job_id] = job
+            self.next_seq = max(self.next_seq, job.seq + 1)
+
+    def _save(self):
+        """Write the queue atomically, caller must hold the condition"""
+        temp_file = self.queue_file + ".tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump([job.to_dict() for job in self.jobs.values()], f, ensure_ascii=False)
+            os.replace(temp_file, self.queue_file)
+        except Exception as e:
+            print(f"Error saving download queue: {e}")
+
+    @contextmanager
+    def _locked(self):
+        """Hold the condition, then tell on_change about what changed once it is released.
+
+        Listeners never run under the queue's lock, so one that waits on
+        another thread (Tk) can't deadlock against a caller of the queue.
+        """
+        with self.condition:
+            yield
+            changes, self.pending_changes = self.pending_changes, []
+        if self.on_change:
+            for job in changes:
+                self.on_change(job)
+
+    def _changed(self, job=None, persist=True):
+        """Persist and wake the workers, caller must hold the condition through _locked()"""
+        if persist:
+            self._save()
+        self.condition.notify_all()
+        self.pending_changes.append(job)
+
+    # Adding work
+
+    def enqueue_chapters(self, chapters, manga_title, save_path, manga_id=None, priority=0, output_format=None):
+        """Queue a list of chapters, already queued chapters are skipped"""
+        added = []
+        with self._locked():
+            queued_ids = {
+                job.chapter['id'] for job in self.jobs.values()
+                if job.status in (QUEUED, DOWNLOADING, PAUSED)
+            }
+
+            for chapter in chapters:
+                if chapter['id'] in queued_ids:
+                    continue
+
+                job = DownloadJob(_compact_chapter(chapter), manga_title, save_path,
+                                  manga_id=manga_id, priority=priority, seq=self.next_seq,
+                                  output_format=output_format)
+                self.next_seq += 1
+                self.jobs[job.job_id] = job
+                queued_ids.add(chapter['id'])
+                added.append(job)
+
+            if added:
+                self._changed()
+        return added
+
+    def enqueue_range(self, chapters, start, end, manga_title, save_path, manga_id=None, priority=0,
+                      output_format=None, languages=None, prefer_groups=(), best_release=True):
+        """Queue every chapter numbered between start and end (inclusive).
+
+        With best_release only one release of each chapter (per language) is
+        queued, preferring the groups in prefer_groups.
+        """
+        catalog = ChapterCatalog(chapters)
+        selected = catalog.select(start, end, languages)
+        if best_release:
+            selected = catalog.best_releases(selected, prefer_groups)
+        return self.enqueue_chapters(selected, manga_title, save_path, manga_id, priority, output_format)
+
+    def enqueue_manga(self, manga, save_path, priority=0, all_languages=False, output_format=None,
+                      prefer_groups=(), best_release=True, prefer_languages=None):
+        """Queue every chapter of a manga, by default one release per chapter.
+
+        With all_languages the feed holds every translation, best_release
+        then still queues each chapter once, in the first language of
+        prefer_languages (ALL_LANGUAGES order by default) that has it.
+        """
+        api = self.downloader.api
+        if all_languages:
+            chapters = api.get_all_manga_chapters(manga['id'])
+            if prefer_languages is None:
+                prefer_languages = ALL_LANGUAGES
+        else:
+            chapters = api.get_manga_chapters(manga['id'])
+
+        catalog = ChapterCatalog(chapters)
+        if best_release:
+            chapters = catalog.best_releases(prefer_groups=prefer_groups, prefer_languages=prefer_languages)
+        else:
+            chapters = catalog.select()
+
+        return self.enqueue_chapters(chapters, api.get_manga_title(manga), save_path,
+                                     manga_id=manga['id'], priority=priority, output_format=output_format)
+
+    # Job control
+
+    def get_jobs(self):
+        """Snapshot of all jobs in scheduling order"""
+        with self._locked():
+            return sorted(self.jobs.values(), key=lambda job: (-job.priority, job.seq))
+
+    def get_job(self, job_id):
+        with self._locked():
+            return self.jobs.get(job_id)
+
+    def pause(self, job_id):
+        with self._locked():
+            job = self.jobs.get(job_id)
+            if job and job.status in (QUEUED, DOWNLOADING):
+                # An active download stops at its next page and comes back as paused
+                job.cancel_event.set()
+                job.status = PAUSED
+                job.message = "Paused"
+                self._changed(job)
+
+    def resume(self, job_id):
+        with self._locked():
+            job = self.jobs.get(job_id)
+            if job and job.status in (PAUSED, FAILED):
+                job.status = QUEUED
+                job.message = ""
+                job.progress = 0
+                self._changed(job)
+
+    def pause_all(self):
+        for job in self.get_jobs():
+            self.pause(job.job_id)
+
+    def resume_all(self):
+        for job in self.get_jobs():
+            self.resume(job.job_id)
+
+    def set_priority(self, job_id, priority):
+        with self._locked():
+            job = self.jobs.get(job_id)
+            if job:
+                job.priority = priority
+                self._changed(job)
+
+    def remove(self, job_id):
+        with self._locked():
+            job = self.jobs.pop(job_id, None)
+            if job:
+                job.cancel_event.set()
+                self._changed(job)
+
+    def clear_finished(self):
+        with self._locked():
+            for job_id in [job_id for job_id, job in self.jobs.items() if job.status == DONE]:
+                del self.jobs[job_id]
+            self._changed()
+
+    # Scheduler
+
+    def start(self):
+        with self._locked():
+            if self.running:
+                return
+            self.running = True
+
+        self.workers = []
+        for i in range(self.max_active_chapters):
+            worker = threading.Thread(target=self._worker, name=f"download-queue-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        """Stop scheduling, active chapters are interrupted and re-queued"""
+        with self._locked():
+            self.running = False
+            for job in self.jobs.values():
+                if job.status == DOWNLOADING:
+                    job.cancel_event.set()
+            self.condition.notify_all()
+
+    def _next_job(self):
+        """Wait for the highest priority queued job, returns None when stopped"""
+        with self._locked():
+            while self.running:
+                queued = [job for job in self.jobs.values()
+                          if job.status == QUEUED and job.job_id not in self.running_jobs]
+                if queued:
+                    job = min(queued, key=lambda job: (-job.priority, job.seq))
+                    self.running_jobs.add(job.job_id)
+                    job.status = DOWNLOADING
+                    job.message = "Starting..."
+                    job.cancel_event.clear()
+                    self._changed(job)
+                    return job
+                self.condition.wait()
+            return None
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._run_job(job)
+            finally:
+                with self._locked():
+                    self.running_jobs.discard(job.job_id)
+                    # A job resumed while this run was winding down can be picked up now
+                    self.condition.notify_all()
+
+    def _job_progress(self, job, progress):
+        with self._locked():
+            if job.status == DOWNLOADING and progress != job.progress:
+                job.progress = progress
+                self._changed(job, persist=False)
+
+    def _job_status(self, job, status):
+        with self._locked():
+            if job.status == DOWNLOADING:
+                job.message = status
+                self._changed(job, persist=False)
+
+    def _run_job(self, job):
+        if self.progress_bus:
+            # Page progress goes to the bus, the job only changes on state transitions
+            progress_callback = status_callback = None
+        else:
+            progress_callback = partial(self._job_progress, job)
+            status_callback = partial(self._job_status, job)
+
+        try:
+            file_path = self.downloader.download_chapter(
+                job.chapter, job.manga_title, job.save_path,
+                progress_callback, status_callback,
+                cancel_event=job.cancel_event, manga_id=job.manga_id, output_format=job.output_format,
+                progress_bus=self.progress_bus, job_id=job.job_id
+            )
+        except DownloadCancelled:
+            with self._locked():
+                # Stopped by pause()/remove(), or re-queued because the queue stopped
+                if job.status == DOWNLOADING:
+                    job.status = QUEUED
+                    job.message = ""
+                    job.progress = 0
+                    self._changed(job)
+            return
+        except Exception as e:
+            with self._locked():
+                if job.status == DOWNLOADING:
+                    job.status = FAILED
+                    job.message = str(e)
+                    self._changed(job)
+            return
+
+        with self._locked():
+            job.file_path = file_path
+            # Paused or removed while the file was being written: leave it that way
+            if job.status == DOWNLOADING:
+                job.status = DONE
+                job.progress = 100
+                job.message = "Done"
+                self._changed(job)
@@ -1,98 +1,427 @@
 import os
-import io
-import tempfile
-from PIL import Image
-import img2pdf
-from mangadx_api import MangaDexAPI
-from utils import sanitize_filename, save_to_history, create_directory_if_not_exists
+import time
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from adaptive_concurrency import AdaptiveConcurrency
+from chapter_staging import ChapterStaging
+from image_pipeline import ImagePipeline
+from mangadx_api import MangaDexAPI, build_page_url
+from metrics import REGISTRY, NODE_LATENCY, PAGE_BYTES, PAGES, OUTPUT_WRITE, CHAPTER_TIME, Throughput
+from node_health import NodeHealth
+from progress_bus import STARTING, DOWNLOADING, WRITING, DONE, FAILED, CANCELLED
+from output_formats import DEFAULT_FORMAT, OUTPUT_FORMATS, open_writer, needs_conversion, merge_files
+from utils import sanitize_filename, save_to_history, get_history_store, parse_chapter_number
+
+class DownloadCancelled(Exception):
+    """Raised when a chapter download is stopped through its cancel event"""
+
+class ChapterSource:
+    """The at-home node currently serving a chapter's pages.
+
+    Pages read the current node when they start, so after a switch only the
+    remaining pages move to the new node. Used from the API event loop only.
+    """
+
+    def __init__(self, client, chapter_id, server, max_switches=3):
+        self.client = client
+        self.chapter_id = chapter_id
+        self.server = server
+        self.switches_left = max_switches
+        # Future for the node lookup in progress, if any
+        self.switching = None
+
+    @property
+    def page_count(self):
+        return len(self.server['data'])
+
+    def page_url(self, index, data_saver=False):
+        """Return (url, base_url) for a page on the current node"""
+        server = self.server
+        if data_saver and len(server['data_saver']) != len(server['data']):
+            return None, server['base_url']
+        return build_page_url(server, index, data_saver), server['base_url']
+
+    async def switch_node(self, bad_base_url):
+        """Ask for a fresh node unless another page already did, returns True when moved.
+
+        Pages failing on the same node while the lookup runs wait for its
+        answer instead of asking again.
+        """
+        if self.server['base_url'] != bad_base_url:
+            # Another page already switched away from this node
+            return True
+        if self.switching is not None:
+            return await asyncio.shield(self.switching)
+        if self.switches_left <= 0:
+            return False
+        self.switches_left -= 1
+        pending = self.switching = asyncio.get_running_loop().create_future()
+        chapter_hash = self.server['hash']
+
+        moved = False
+        try:
+            server = await self.client.get_chapter_server(self.chapter_id, use_cache=False)
+            # A new hash means the chapter changed upstream, the page list no longer matches
+            if server and server['hash'] == chapter_hash:
+                if server['base_url'] != bad_base_url:
+                    print(f"Switching chapter {self.chapter_id} from {bad_base_url} to {server['base_url']}")
+                self.server = server
+                moved = True
+            return moved
+        finally:
+            self.switching = None
+            pending.set_result(moved)
 
 class MangaDownloader:
-    def __init__(self):
-        self.api = MangaDexAPI()
-    
-    def download_chapter(self, chapter_data, manga_title, save_path, progress_callback=None, status_callback=None):
-        """Download a complete chapter and save as PDF"""
+    def __init__(self, api=None, max_workers=6, global_max_workers=24,
+                 data_saver_fallback=True, allow_missing_pages=False, node_health=None, image_pipeline=None,
+                 output_format=DEFAULT_FORMAT, adaptive_concurrency=True, data_saver_below=None):
+        self.api = api or MangaDexAPI()
+
+        # Pages fetched at once for a single chapter, also the global starting point when adaptive
+        self.max_workers = max_workers
+
+        # Pages fetched at once across every chapter using this downloader. When
+        # adaptive the limit moves between 1 and this ceiling with the measured
+        # throughput, otherwise it stays fixed
+        self.global_max_workers = global_max_workers
+        if adaptive_concurrency:
+            self.concurrency = AdaptiveConcurrency(initial=max_workers, maximum=global_max_workers,
+                                                   data_saver_below=data_saver_below)
+        else:
+            self.concurrency = AdaptiveConcurrency(initial=global_max_workers, minimum=global_max_workers,
+                                                   maximum=global_max_workers)
+
+        # Last resort for a page no node could deliver: the compressed dataSaver copy
+        self.data_saver_fallback = data_saver_fallback
+        # Write the chapter even if some pages could not be fetched at all
+        self.allow_missing_pages = allow_missing_pages
+
+        # Latency and error rate of every at-home node we have used
+        self.node_health = node_health or NodeHealth()
+
+        # Page conversions run in a process pool shared by all chapters
+        self.image_pipeline = image_pipeline or ImagePipeline()
+
+        # Page fetches are coroutines on the API event loop, the disk work around
+        # them (staged page checks, commits, handing pages to the image pipeline)
+        # runs here so it never stalls the loop
+        self.page_io = ThreadPoolExecutor(max_workers=4, thread_name_prefix='page-io')
+
+        # 'pdf' or 'cbz', download_chapter can override it per chapter
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.output_format = output_format
+
+        REGISTRY.register_collector('node_health', self._collect_metrics)
+
+    def _collect_metrics(self):
+        nodes = self.node_health.stats()
+        return {
+            'node_latency_ewma_seconds': [({'node': node}, stats['latency']) for node, stats in nodes.items()],
+            'node_error_rate': [({'node': node}, stats['error_rate']) for node, stats in nodes.items()]
+        }
+
+    async def _download_from_node(self, url, base_url, part_path):
+        """Stream one page to part_path and record how the node behaved, returns its size or None"""
+        async with self.concurrency.slot():
+            start = time.monotonic()
+            size = await self.api.client.download_page_to(url, part_path, retries=2)
+            latency = time.monotonic() - start
+        self.concurrency.record(latency, size)
+        self.node_health.record(base_url, latency, size is not None)
+
+        NODE_LATENCY.observe(latency, node=base_url)
+        if size is not None:
+            PAGE_BYTES.inc(size)
+        return size
+
+    async def _page_ready(self, path, convert):
+        """Future for the file the writer should read, converted only when the format needs it"""
+        if convert:
+            # Hand the page to the CPU stage, this blocks a page_io thread while that stage is full
+            return await asyncio.get_running_loop().run_in_executor(self.page_io, self.image_pipeline.submit, path)
+        future = Future()
+        future.set_result(path)
+        return future
+
+    async def _fetch_page(self, limit, source, index, staging, convert=True, throughput=None, data_saver=False):
+        """Download one page into the staging folder, holding the chapter's limit semaphore.
+
+        Returns a future for the page file ready for the output writer (from
+        the image pipeline when convert is set), or None when the page could
+        not be downloaded. data_saver fetches the smaller dataSaver copy; a
+        full quality chapter refetches dataSaver pages left by earlier runs.
+        """
+        async with limit:
+            return await self._fetch_staged_page(source, index, staging, convert, throughput, data_saver)
+
+    async def _fetch_staged_page(self, source, index, staging, convert, throughput, data_saver):
+        loop = asyncio.get_running_loop()
+        staged_path = await loop.run_in_executor(
+            self.page_io, lambda: staging.page_path(index, data_saver_ok=data_saver))
+        if staged_path:
+            # Already fetched by an earlier, interrupted run
+            PAGES.inc(result='staged')
+            return await self._page_ready(staged_path, convert)
+
+        size = None
+
+        # Try the current node, moving to a fresh one when it fails. Pages are
+        # streamed straight into the staging folder and verified against the
+        # hash in their filename, a corrupt or short page counts as a failure
+        while size is None:
+            url, base_url = source.page_url(index, data_saver)
+            if url is None:
+                # No dataSaver list matching this chapter's pages
+                data_saver = False
+                continue
+            stored_name = url.rsplit('/', 1)[-1]
+            size = await self._download_from_node(url, base_url, staging.part_path(index, stored_name))
+
+            if size is None:
+                if not await source.switch_node(base_url):
+                    break
+            elif self.node_health.is_unhealthy(base_url):
+                # Works but slow or flaky, move the remaining pages elsewhere
+                await source.switch_node(base_url)
+
+        if size is None and self.data_saver_fallback and not data_saver:
+            url, base_url = source.page_url(index, data_saver=True)
+            if url:
+                print(f"Falling back to dataSaver for page {index+1}")
+                data_saver = True
+                stored_name = url.rsplit('/', 1)[-1]
+                size = await self._download_from_node(url, base_url, staging.part_path(index, stored_name))
+
+        if not size:
+            print(f"Failed to download page {index+1}")
+            PAGES.inc(result='failed')
+            return None
+
+        PAGES.inc(result='downloaded')
+        if throughput:
+            throughput.add(size)
+
+        staged_path = await loop.run_in_executor(self.page_io, staging.commit_page, index, stored_name, data_saver)
+        return await self._page_ready(staged_path, convert)
+
+    def _read_page(self, page_future, index):
+        """Wait for a page to leave the image pipeline, returns its bytes or None"""
+        try:
+            with open(page_future.result(), 'rb') as f:
+                return f.read()
+        except Exception as e:
+            print(f"Error processing page {index+1}: {e}")
+            return None
+
+    def download_chapter(self, chapter_data, manga_title, save_path, progress_callback=None, status_callback=None,
+                         max_workers=None, cancel_event=None, manga_id=None, output_format=None,
+                         progress_bus=None, job_id=None):
+        """Download a complete chapter and save it as PDF or CBZ.
+
+        Progress goes to progress_callback/status_callback on the calling
+        thread, or as structured updates to progress_bus under job_id (the
+        chapter id by default) for a UI that drains them at its own pace.
+        """
+        chapter_started = time.monotonic()
+        job_id = job_id or chapter_data.get('id')
+
+        def report(stage, message, progress=None):
+            if status_callback:
+                status_callback(message)
+            if progress_callback and progress is not None:
+                progress_callback(progress)
+            if progress_bus:
+                progress_bus.stage(job_id, stage, message, progress)
+
         try:
             chapter_id = chapter_data['id']
             chapter_attrs = chapter_data.get('attributes', {})
             chapter_num = chapter_attrs.get('chapter', 'Unknown')
-            
-            if status_callback:
-                status_callback(f"Getting page URLs for Chapter {chapter_num}...")
-            
-            # Get page URLs
-            page_urls = self.api.get_chapter_pages(chapter_id)
-            if not page_urls:
+            output_format = output_format or self.output_format
+
+            # Feed chapters carry their manga as a relationship
+            if manga_id is None:
+                for relationship in chapter_data.get('relationships', []):
+                    if relationship.get('type') == 'manga':
+                        manga_id = relationship.get('id')
+
+            report(STARTING, f"Getting page URLs for Chapter {chapter_num}...")
+
+            # Get the at-home node and page list
+            server = self.api.get_chapter_server(chapter_id)
+            if not server:
                 raise Exception("No pages found for this chapter")
-            
-            if status_callback:
-                status_callback(f"Found {len(page_urls)} pages. Starting download...")
-            
-            # Create temporary directory for images
-            with tempfile.TemporaryDirectory() as temp_dir:
-                image_files = []
-                
-                # Download all pages
-                for i, url in enumerate(page_urls):
-                    if status_callback:
-                        status_callback(f"Downloading page {i+1}/{len(page_urls)}...")
-                    
-                    if progress_callback:
-                        progress = int((i / len(page_urls)) * 80)  # 80% for download
-                        progress_callback(progress)
-                    
-                    # Download page
-                    page_data = self.api.download_page(url)
-                    if page_data:
-                        # Save temporary image file
-                        page_filename = f"page_{i+1:03d}.jpg"
-                        page_path = os.path.join(temp_dir, page_filename)
-                        
-                        try:
-                            # Verify it's a valid image and convert if necessary
-                            img = Image.open(io.BytesIO(page_data))
-                            # Convert to RGB if necessary
-                            if img.mode in ('RGBA', 'P'):
-                                img = img.convert('RGB')
-                            img.save(page_path, 'JPEG', quality=95)
-                            image_files.append(page_path)
-                        except Exception as e:
-                            print(f"Error processing page {i+1}: {e}")
-                            continue
-                    else:
-                        print(f"Failed to download page {i+1}")
-                
-                if not image_files:
-                    raise Exception("No pages were successfully downloaded")
-                
+
+            source = ChapterSource(self.api.client, chapter_id, server)
+            total_pages = source.page_count
+            # At most max_workers pages of this chapter at once, the concurrency
+            # controller caps how many fetch at once across all chapters
+            workers = max(1, min(max_workers or self.max_workers, total_pages))
+
+            # Quality is decided once per chapter, on a slow link the controller may
+            # ask for the smaller dataSaver copies
+            data_saver = self.concurrency.data_saver
+
+            # Pages from an interrupted earlier attempt are picked up again
+            staging = ChapterStaging(save_path, chapter_id, server['hash'], server['data'])
+            staged = staging.staged_count(data_saver_ok=data_saver)
+
+            if staged:
+                report(DOWNLOADING, f"Resuming: {staged}/{total_pages} pages already downloaded...")
+            else:
+                report(DOWNLOADING,
+                       f"Found {total_pages} pages. Downloading ({self.concurrency.describe()})...")
+
+            # Create output filename
+            safe_manga_title = sanitize_filename(manga_title)
+            safe_chapter = sanitize_filename(str(chapter_num))
+            output_filename = f"{safe_manga_title}_chapter_{safe_chapter}.{output_format}"
+            output_path = os.path.join(save_path, output_filename)
+            part_path = output_path + ".part"
+
+            # CBZ stores the downloaded bytes untouched, only PDF needs the image pipeline
+            convert = needs_conversion(output_format)
+            metadata = {
+                'series': manga_title,
+                'number': chapter_attrs.get('chapter'),
+                'volume': chapter_attrs.get('volume'),
+                'title': chapter_attrs.get('title'),
+                'language': chapter_attrs.get('translatedLanguage')
+            }
+
+            # Pages may finish out of order, progress counts every finished page
+            completed = [0]
+            throughput = Throughput()
+            write_seconds = 0.0
+
+            def page_done():
+                completed[0] += 1
+                done = completed[0]
+
+                progress = int((done / total_pages) * 95)  # 95% for download + output file
+                if progress_bus:
+                    # Cumulative counters, the bus keeps only the latest per job
+                    progress_bus.pages(job_id, done, total_pages, throughput.pages, throughput.bytes, progress)
+
                 if status_callback:
-                    status_callback("Creating PDF...")
-                
-                if progress_callback:
-                    progress_callback(90)
-                
-                # Create PDF filename
-                safe_manga_title = sanitize_filename(manga_title)
-                safe_chapter = sanitize_filename(str(chapter_num))
-                pdf_filename = f"{safe_manga_title}_chapter_{safe_chapter}.pdf"
-                pdf_path = os.path.join(save_path, pdf_filename)
-                
-                # Create PDF using img2pdf
-                with open(pdf_path, "wb") as f:
-                    f.write(img2pdf.convert(image_files))
-                
+                    status_callback(f"Downloaded page {done}/{total_pages} "
+                                    f"({throughput.describe()}, {self.concurrency.describe()})...")
+
                 if progress_callback:
-                    progress_callback(100)
-                
-                if status_callback:
-                    status_callback(f"PDF saved: {pdf_filename}")
-                
-                # Save to history
-                save_to_history(manga_title, chapter_num, pdf_path)
-                
-                return pdf_path
-                
+                    progress_callback(progress)
+
+            # Pages land in the staging folder and, for PDF, go through the image
+            # pipeline while later pages are still downloading. The fetches run as
+            # coroutines on the API loop, this thread reports each one as it
+            # finishes and the writer reads them back in order as their turn comes
+            limit = asyncio.Semaphore(workers)
+            pending = {}
+            fetched = {}
+            missing_pages = []
+
+            try:
+                with open_writer(output_format, part_path, metadata) as writer:
+                    for index in range(total_pages):
+                        future = asyncio.run_coroutine_threadsafe(
+                            self._fetch_page(limit, source, index, staging, convert, throughput, data_saver),
+                            self.api.loop)
+                        pending[future] = index
+
+                    for index in range(total_pages):
+                        while index not in fetched:
+                            if cancel_event is not None and cancel_event.is_set():
+                                raise DownloadCancelled(f"Chapter {chapter_num} download cancelled")
+
+                            # Wake up now and then to notice a cancel request
+                            finished, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                            for future in finished:
+                                fetched[pending.pop(future)] = future.result()
+                                page_done()
+
+                        page_future = fetched.pop(index)
+                        page = self._read_page(page_future, index) if page_future else None
+                        if page:
+                            write_started = time.perf_counter()
+                            writer.add_page(page)
+                            write_seconds += time.perf_counter() - write_started
+                        else:
+                            missing_pages.append(index + 1)
+
+                    if not writer.page_count:
+                        raise Exception("No pages were successfully downloaded")
+
+                    if missing_pages and not self.allow_missing_pages:
+                        raise Exception(f"Failed to download pages: {', '.join(map(str, missing_pages))}")
+
+                    report(WRITING, f"Writing {output_filename}...", 95)
+                    write_started = time.perf_counter()
+                    writer.close()
+                    write_seconds += time.perf_counter() - write_started
+                    OUTPUT_WRITE.observe(write_seconds, format=output_format)
+
+                os.replace(part_path, output_path)
+            finally:
+                # Stops the fetches still waiting or running after a failure or cancel
+                for future in pending:
+                    future.cancel()
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+            # The chapter is complete, staged pages are no longer needed
+            staging.cleanup()
+
+            report(DONE, f"{output_format.upper()} saved: {output_filename}", 100)
+
+            # Save to history
+            save_to_history(manga_title, chapter_num, output_path, manga_id=manga_id, chapter_id=chapter_id,
+                            volume=chapter_attrs.get('volume'), language=chapter_attrs.get('translatedLanguage'))
+
+            CHAPTER_TIME.observe(time.monotonic() - chapter_started, format=output_format, result='ok')
+            return output_path
+
         except Exception as e:
-            if status_callback:
-                status_callback(f"Error: {str(e)}")
-            raise e
\ No newline at end of file
+            cancelled = isinstance(e, DownloadCancelled)
+            CHAPTER_TIME.observe(time.monotonic() - chapter_started, format=output_format or self.output_format,
+                                 result='cancelled' if cancelled else 'failed')
+            report(CANCELLED if cancelled else FAILED, f"Error: {str(e)}")
+            raise e
+
+    def merge_volume(self, manga_id, volume, save_path, manga_title=None, language=None,
+                     output_format=None, status_callback=None):
+        """Combine the downloaded chapters of one volume into a single file.
+
+        Pages are copied out of the chapter files listed in the download
+        history, nothing is downloaded or re-encoded. Returns the merged path.
+        """
+        output_format = output_format or self.output_format
+
+        # Newest download of every chapter that still exists on disk
+        chapters = {}
+        for entry in get_history_store().entries(manga_id=manga_id, volume=str(volume), language=language):
+            key = entry['chapter_id'] or entry['file_path']
+            if key not in chapters and os.path.exists(entry['file_path']):
+                chapters[key] = entry
+
+        if not chapters:
+            raise Exception(f"No downloaded chapters found for volume {volume}")
+
+        entries = sorted(chapters.values(), key=lambda entry: (
+            parse_chapter_number(entry['chapter_number']) is None,
+            parse_chapter_number(entry['chapter_number']) or 0
+        ))
+        manga_title = manga_title or entries[0]['manga_title']
+
+        output_filename = f"{sanitize_filename(manga_title)}_volume_{sanitize_filename(str(volume))}.{output_format}"
+        output_path = os.path.join(save_path, output_filename)
+
+        if status_callback:
+            status_callback(f"Merging {len(entries)} chapters into {output_filename}...")
+
+        merge_files([entry['file_path'] for entry in entries], output_path, output_format,
+                    metadata={'series': manga_title, 'volume': volume, 'language': language})
+
+        if status_callback:
+            status_callback(f"{output_format.upper()} saved: {output_filename}")
+        return output_path
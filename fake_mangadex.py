@@ -0,0 +1,226 @@
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from PIL import Image
+
+IMAGE_FORMATS = {'jpeg': ('JPEG', 'jpg'), 'png': ('PNG', 'png'), 'webp': ('WEBP', 'webp')}
+
+def synthetic_page(width, height, image_format='jpeg', seed=0):
+    """A noisy grayscale-ish page image, noise keeps the encoded size realistic"""
+    pil_format, _ = IMAGE_FORMATS[image_format]
+    noise = Image.effect_noise((width, height), 40 + seed % 20).convert('RGB')
+    output = io.BytesIO()
+    if pil_format == 'JPEG':
+        noise.save(output, pil_format, quality=85)
+    else:
+        noise.save(output, pil_format)
+    return output.getvalue()
+
+class FakeMangaDex:
+    """Local stand-in for api.mangadex.org and one MangaDex@Home node.
+
+    Serves /manga (search), /manga/{id}/feed, /at-home/server/{id} and the
+    page images under /data and /data-saver, from two servers so the client
+    sees separate API and node hosts. Latency, jitter, error and truncation
+    rates and an API rate limit (sent back as X-RateLimit-* headers and 429s)
+    can all be tuned.
+    """
+
+    def __init__(self, manga_count=20, chapters_per_manga=10, pages_per_chapter=20,
+                 page_width=1000, page_height=1400, image_format='jpeg',
+                 latency=0.0, jitter=0.0, error_rate=0.0, truncate_rate=0.0, api_rate_limit=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.api_rate_limit = api_rate_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window_start = 0
+        self.window_count = 0
+        self.requests = {'api': 0, 'node': 0, 'errors': 0, 'rate_limited': 0, 'truncated': 0}
+
+        namespace = uuid.UUID(int=seed)
+        self.manga = [{
+            'id': str(uuid.uuid5(namespace, f"manga-{m}")),
+            'type': 'manga',
+            'attributes': {'title': {'en': f"Benchmark Manga {m}"}},
+            'relationships': []
+        } for m in range(manga_count)]
+
+        self.feeds = {}
+        for manga in self.manga:
+            self.feeds[manga['id']] = [{
+                'id': str(uuid.uuid5(namespace, f"{manga['id']}-{c}")),
+                'type': 'chapter',
+                'attributes': {
+                    'chapter': str(c + 1), 'volume': str(c // 10 + 1), 'title': None,
+                    'translatedLanguage': 'en', 'pages': pages_per_chapter,
+                    'updatedAt': '2024-01-01T00:00:00+00:00', 'readableAt': '2024-01-01T00:00:00+00:00'
+                },
+                'relationships': [{'type': 'manga', 'id': manga['id']}]
+            } for c in range(chapters_per_manga)]
+
+        # Every chapter shares one set of pages, named the way at-home names them
+        _, extension = IMAGE_FORMATS[image_format]
+        self.pages = {}
+        for index in range(pages_per_chapter):
+            data = synthetic_page(page_width, page_height, image_format, seed + index)
+            self.pages[f"{index + 1}-{hashlib.sha256(data).hexdigest()}.{extension}"] = data
+        self.page_names = list(self.pages)
+        self.chapter_hash = hashlib.sha1(''.join(self.page_names).encode()).hexdigest()
+
+        self.api_server = None
+        self.node_server = None
+
+    @property
+    def api_url(self):
+        return f"http://127.0.0.1:{self.api_server.server_port}"
+
+    @property
+    def node_url(self):
+        return f"http://127.0.0.1:{self.node_server.server_port}"
+
+    @property
+    def chapters(self):
+        return [chapter for feed in self.feeds.values() for chapter in feed]
+
+    def start(self):
+        self.api_server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler(self._handle_api))
+        self.node_server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler(self._handle_node))
+        for server in (self.api_server, self.node_server):
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in (self.api_server, self.node_server):
+            if server:
+                server.shutdown()
+                server.server_close()
+
+    def _handler(self, handle):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                handle(self)
+
+        return Handler
+
+    def _send(self, request, body, status=200, content_type='application/json', headers=None, truncate=False):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, str(value))
+        request.end_headers()
+        if truncate:
+            # Promise the whole body, deliver half and hang up
+            request.wfile.write(body[:len(body) // 2])
+            request.close_connection = True
+            return
+        request.wfile.write(body)
+
+    def _delay_and_fail(self, request, kind):
+        """Simulated latency and errors, returns True when the request was answered with an error"""
+        with self.lock:
+            self.requests[kind] += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.requests['errors'] += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self._send(request, {'result': 'error', 'errors': [{'status': 503}]}, status=503)
+        return failed
+
+    def _rate_limit_headers(self):
+        """Fixed one-second window, returns (headers, limited)"""
+        if not self.api_rate_limit:
+            return {}, False
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= 1:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            remaining = max(0, self.api_rate_limit - self.window_count)
+            limited = self.window_count > self.api_rate_limit
+            if limited:
+                self.requests['rate_limited'] += 1
+            headers = {
+                'X-RateLimit-Limit': self.api_rate_limit,
+                'X-RateLimit-Remaining': remaining,
+                'X-RateLimit-Retry-After': math.ceil(self.window_start + 1)
+            }
+        return headers, limited
+
+    def _handle_api(self, request):
+        headers, limited = self._rate_limit_headers()
+        if limited:
+            return self._send(request, {'result': 'error', 'errors': [{'status': 429}]}, 429, headers=headers)
+        if self._delay_and_fail(request, 'api'):
+            return
+
+        url = urlparse(request.path)
+        query = parse_qs(url.query)
+        offset = int(query.get('offset', ['0'])[0])
+        limit = int(query.get('limit', ['10'])[0])
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['manga']:
+            page = self.manga[offset:offset + limit]
+            return self._send(request, {'result': 'ok', 'data': page, 'limit': limit, 'offset': offset,
+                                        'total': len(self.manga)}, headers=headers)
+
+        if len(parts) == 3 and parts[0] == 'manga' and parts[2] == 'feed':
+            feed = self.feeds.get(parts[1])
+            if feed is None:
+                return self._send(request, {'result': 'error'}, 404, headers=headers)
+            return self._send(request, {'result': 'ok', 'data': feed[offset:offset + limit], 'limit': limit,
+                                        'offset': offset, 'total': len(feed)}, headers=headers)
+
+        if len(parts) == 3 and parts[:2] == ['at-home', 'server']:
+            return self._send(request, {
+                'result': 'ok',
+                'baseUrl': self.node_url,
+                'chapter': {'hash': self.chapter_hash, 'data': self.page_names, 'dataSaver': self.page_names}
+            }, headers=headers)
+
+        self._send(request, {'result': 'error'}, 404, headers=headers)
+
+    def _handle_node(self, request):
+        if self._delay_and_fail(request, 'node'):
+            return
+
+        parts = [part for part in urlparse(request.path).path.split('/') if part]
+        if len(parts) != 3 or parts[0] not in ('data', 'data-saver') or parts[2] not in self.pages:
+            return self._send(request, b'Not found', 404, 'text/plain')
+
+        with self.lock:
+            truncate = self.random.random() < self.truncate_rate
+            if truncate:
+                self.requests['truncated'] += 1
+        content_type = 'image/' + parts[2].rsplit('.', 1)[1].replace('jpg', 'jpeg')
+        self._send(request, self.pages[parts[2]], content_type=content_type, truncate=truncate)
+
+def serve(options, ready):
+    """Run a FakeMangaDex in this process until killed, reporting its URLs on ready"""
+    fake = FakeMangaDex(**options).start()
+    ready.put({'api_url': fake.api_url, 'node_url': fake.node_url,
+               'chapters': fake.chapters, 'manga': fake.manga})
+    threading.Event().wait()
@@ -1,27 +1,76 @@
+import base64
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import threading
-from mangadx_api import MangaDexAPI
+from concurrent.futures import ThreadPoolExecutor
+from mangadx_api import MangaDexAPI, ALL_LANGUAGES
 from downloader import MangaDownloader
-from utils import format_chapter_display
+from download_queue import DownloadQueue, DOWNLOADING
+from metrics import REGISTRY
+from progress_bus import ProgressBus
+from watch_list import WatchList
+from widgets import VirtualListbox
+from chapter_catalog import ChapterCatalog, chapter_groups
+from cover_cache import CoverThumbnails, THUMBNAIL_SIZE
+from utils import format_chapter_display, parse_chapter_number
+
+# Download progress is drained from the bus and redrawn at most this often (20 fps)
+PROGRESS_FRAME_MS = 50
+
+# Below this measured bandwidth "Data saver on slow links" fetches dataSaver pages
+SLOW_LINK_BYTES_PER_SECOND = 150 * 1024
 
 class MangaDexDownloaderGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("MangaDex Downloader")
-        self.root.geometry("900x700")
+        self.root.geometry("900x880")
         
         # Initialize API and downloader
         self.api = MangaDexAPI()
-        self.downloader = MangaDownloader()
+        self.downloader = MangaDownloader(self.api)
+        # Page conversion workers are started from the main thread, before any download runs
+        self.downloader.image_pipeline.start()
+        
+        # Search result covers, loaded in the background for visible rows only
+        self.covers = CoverThumbnails(self.api)
+        self.cover_requests = {}
         
         # Data storage
         self.manga_results = []
         self.selected_manga = None
         self.chapter_results = []
         self.selected_chapter = None
+        self.queue_save_dir = None
+        # Set by queue worker threads, the progress timer refreshes the queue view when it sees it
+        self.queue_dirty = threading.Event()
+        
+        # Running searches/chapter loads, bumping the generation drops stale results
+        self.search_generation = 0
+        self.search_cancel = threading.Event()
+        self.chapter_generation = 0
+        self.chapter_cancel = threading.Event()
+        # Chapter row text is built here, neither on the Tk thread nor on the API event loop,
+        # and search batches pass through on their way to Tk. One thread keeps batches
+        # (and the final sorted list) in arrival order
+        self.chapter_rows = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chapter-rows")
+        
+        # Download workers publish progress here, the UI drains it on a fixed timer
+        self.progress_bus = ProgressBus()
+        self.active_download = None
+        self.queue_progress = {}
+        
+        # Multi-chapter download queue, shares the downloader's page budget
+        self.download_queue = DownloadQueue(self.downloader, on_change=self._on_queue_change,
+                                            progress_bus=self.progress_bus)
+        
+        # Followed manga, new chapters go straight into the queue
+        self.watch_list = WatchList(self.api, download_queue=self.download_queue)
         
         self.setup_ui()
+        self._refresh_queue()
+        self._drain_progress()
+        self.download_queue.start()
     
     def setup_ui(self):
         # Main frame
@@ -68,7 +117,7 @@ class MangaDexDownloaderGUI:
         manga_frame.columnconfigure(0, weight=1)
         manga_frame.rowconfigure(0, weight=1)
         
-        self.manga_listbox = tk.Listbox(manga_frame)
+        self.manga_listbox = VirtualListbox(manga_frame, image_size=THUMBNAIL_SIZE, on_view=self._request_covers)
         self.manga_listbox.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         self.manga_listbox.bind('<<ListboxSelect>>', self.on_manga_select)
         
@@ -94,7 +143,8 @@ class MangaDexDownloaderGUI:
         self.chapter_count_label = ttk.Label(options_frame, text="", foreground="blue")
         self.chapter_count_label.grid(row=0, column=1)
         
-        self.chapter_listbox = tk.Listbox(chapter_frame)
+        # Only the visible rows are drawn, feeds can list thousands of chapters
+        self.chapter_listbox = VirtualListbox(chapter_frame, selectmode=tk.EXTENDED)
         self.chapter_listbox.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         self.chapter_listbox.bind('<<ListboxSelect>>', self.on_chapter_select)
         
@@ -107,9 +157,30 @@ class MangaDexDownloaderGUI:
         download_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
         download_frame.columnconfigure(0, weight=1)
         
-        self.download_btn = ttk.Button(download_frame, text="Download Chapter", 
+        download_options_frame = ttk.Frame(download_frame)
+        download_options_frame.grid(row=0, column=0, pady=(0, 10))
+        
+        self.download_btn = ttk.Button(download_options_frame, text="Download Chapter", 
                                      command=self.download_chapter, state=tk.DISABLED)
-        self.download_btn.grid(row=0, column=0, pady=(0, 10))
+        self.download_btn.grid(row=0, column=0, padx=(0, 10))
+        
+        # Output format, used for single downloads, queued chapters and merges
+        ttk.Label(download_options_frame, text="Format:").grid(row=0, column=1, padx=(0, 5))
+        self.format_var = tk.StringVar(value=self.downloader.output_format)
+        ttk.Radiobutton(download_options_frame, text="PDF", variable=self.format_var, value="pdf").grid(row=0, column=2)
+        ttk.Radiobutton(download_options_frame, text="CBZ", variable=self.format_var, value="cbz").grid(row=0, column=3, padx=(5, 15))
+        
+        # Merge already downloaded chapters of a volume into one file
+        ttk.Label(download_options_frame, text="Vol.").grid(row=0, column=4)
+        self.merge_volume_entry = ttk.Entry(download_options_frame, width=6)
+        self.merge_volume_entry.grid(row=0, column=5, padx=(2, 5))
+        ttk.Button(download_options_frame, text="Merge Volume", 
+                   command=self.merge_volume).grid(row=0, column=6)
+        
+        # Opt-in: smaller dataSaver pages while the measured bandwidth is low
+        self.data_saver_var = tk.BooleanVar(value=bool(self.downloader.concurrency.data_saver_below))
+        ttk.Checkbutton(download_options_frame, text="Data saver on slow links", variable=self.data_saver_var,
+                        command=self.toggle_data_saver).grid(row=0, column=7, padx=(15, 0))
         
         # Progress section
         progress_frame = ttk.Frame(download_frame)
@@ -122,6 +193,69 @@ class MangaDexDownloaderGUI:
         
         self.status_label = ttk.Label(progress_frame, text="Ready")
         self.status_label.grid(row=1, column=0, sticky=tk.W)
+        
+        # Queue section
+        queue_frame = ttk.LabelFrame(main_frame, text="Download Queue", padding="10")
+        queue_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
+        queue_frame.columnconfigure(0, weight=1)
+        queue_frame.rowconfigure(1, weight=1)
+        
+        queue_add_frame = ttk.Frame(queue_frame)
+        queue_add_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 5))
+        
+        ttk.Button(queue_add_frame, text="Queue Selected", 
+                   command=self.queue_selected_chapters).grid(row=0, column=0, padx=(0, 5))
+        ttk.Label(queue_add_frame, text="Ch.").grid(row=0, column=1)
+        self.range_start_entry = ttk.Entry(queue_add_frame, width=6)
+        self.range_start_entry.grid(row=0, column=2)
+        ttk.Label(queue_add_frame, text="to").grid(row=0, column=3, padx=2)
+        self.range_end_entry = ttk.Entry(queue_add_frame, width=6)
+        self.range_end_entry.grid(row=0, column=4, padx=(0, 5))
+        ttk.Button(queue_add_frame, text="Queue Range", 
+                   command=self.queue_chapter_range).grid(row=0, column=5, padx=(0, 5))
+        ttk.Button(queue_add_frame, text="Queue Whole Manga", 
+                   command=self.queue_whole_manga).grid(row=0, column=6, padx=(0, 15))
+        ttk.Button(queue_add_frame, text="Follow", 
+                   command=self.follow_manga).grid(row=0, column=7, padx=(0, 5))
+        ttk.Button(queue_add_frame, text="Check Followed", 
+                   command=self.check_followed).grid(row=0, column=8)
+        
+        # Follows made with this set queue their new chapters on every check
+        self.follow_auto_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(queue_add_frame, text="Auto-download", 
+                        variable=self.follow_auto_var).grid(row=1, column=7, sticky=tk.W, pady=(5, 0))
+        ttk.Button(queue_add_frame, text="Followed...", 
+                   command=self.show_followed).grid(row=1, column=8, pady=(5, 0))
+        
+        # Range and whole-manga queueing keep one release per chapter, this group wins ties
+        ttk.Label(queue_add_frame, text="Prefer group:").grid(row=1, column=0, sticky=tk.E, pady=(5, 0))
+        self.prefer_group_entry = ttk.Entry(queue_add_frame, width=30)
+        self.prefer_group_entry.grid(row=1, column=1, columnspan=5, sticky=(tk.W, tk.E), pady=(5, 0))
+        
+        columns = ('manga', 'chapter', 'priority', 'status', 'progress')
+        self.queue_tree = ttk.Treeview(queue_frame, columns=columns, show='headings', height=6)
+        for column, heading, width in (('manga', 'Manga', 280), ('chapter', 'Chapter', 70),
+                                       ('priority', 'Priority', 60), ('status', 'Status', 220),
+                                       ('progress', 'Progress', 70)):
+            self.queue_tree.heading(column, text=heading)
+            self.queue_tree.column(column, width=width, stretch=(column in ('manga', 'status')))
+        self.queue_tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        queue_scrollbar = ttk.Scrollbar(queue_frame, orient=tk.VERTICAL, command=self.queue_tree.yview)
+        queue_scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        self.queue_tree.configure(yscrollcommand=queue_scrollbar.set)
+        
+        queue_control_frame = ttk.Frame(queue_frame)
+        queue_control_frame.grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
+        for i, (text, command) in enumerate((
+                ("Pause", self.pause_queue_jobs),
+                ("Resume", self.resume_queue_jobs),
+                ("Priority Up", self.raise_queue_priority),
+                ("Remove", self.remove_queue_jobs),
+                ("Clear Finished", self.download_queue.clear_finished),
+                ("Export Metrics", self.export_metrics))):
+            ttk.Button(queue_control_frame, text=text, command=command).grid(row=0, column=i, padx=(0, 5))
     
     def search_manga(self):
         query = self.search_entry.get().strip()
@@ -129,37 +263,93 @@ class MangaDexDownloaderGUI:
             messagebox.showwarning("Warning", "Please enter a manga title to search")
             return
         
-        self.search_btn.configure(state=tk.DISABLED)
+        # A new search supersedes the one still running
+        self.search_cancel.set()
+        self.search_cancel = threading.Event()
+        self.search_generation += 1
+        
+        self.manga_results = []
+        self._cancel_cover_requests()
+        self.manga_listbox.clear()
+        self._clear_chapter_results()
         self.status_label.configure(text="Searching...")
         
         # Run search in separate thread
-        thread = threading.Thread(target=self._search_manga_thread, args=(query,))
+        thread = threading.Thread(target=self._search_manga_thread, 
+                                  args=(query, self.search_generation, self.search_cancel))
         thread.daemon = True
         thread.start()
     
-    def _search_manga_thread(self, query):
+    def _search_manga_thread(self, query, generation, cancel_event):
+        def on_batch(batch):
+            # Called on the API event loop, Tk is only reached from the chapter_rows thread
+            self.chapter_rows.submit(self.root.after, 0, self._append_manga_results, generation, batch)
+        
         try:
-            results = self.api.search_manga(query)
-            self.manga_results = results
-            
-            # Update UI in main thread
-            self.root.after(0, self._update_manga_results, results)
+            # Each batch goes to the listbox as soon as it arrives
+            self.api.search_manga_stream(query, on_batch, cancel_event)
+            # Behind the batches still queued, so the count covers all of them
+            self.chapter_rows.submit(self.root.after, 0, self._search_finished, generation)
             
         except Exception as e:
-            self.root.after(0, self._show_error, f"Search failed: {str(e)}")
+            if not cancel_event.is_set():
+                self.root.after(0, self._show_error, f"Search failed: {str(e)}")
     
-    def _update_manga_results(self, results):
-        self.manga_listbox.delete(0, tk.END)
-        self.chapter_listbox.delete(0, tk.END)
-        self.chapter_count_label.configure(text="")
+    def _append_manga_results(self, generation, batch):
+        # Results of a superseded search are dropped
+        if generation != self.search_generation:
+            return
         
-        for manga in results:
-            title = self.api.get_manga_title(manga)
-            self.manga_listbox.insert(tk.END, title)
+        self.manga_results.extend(batch)
+        self.manga_listbox.extend(self.api.get_manga_title(manga) for manga in batch)
         
-        self.search_btn.configure(state=tk.NORMAL)
+        self.status_label.configure(text=f"Searching... {len(self.manga_results)} manga so far")
+    
+    def _search_finished(self, generation):
+        if generation != self.search_generation:
+            return
+        self.status_label.configure(text=f"Found {len(self.manga_results)} manga")
+    
+    def _request_covers(self, first, last):
+        """Load covers of the manga rows in view, rows scrolled away lose their pending requests"""
+        for index in list(self.cover_requests):
+            if not first <= index < last:
+                self.cover_requests.pop(index).cancel()
+        
+        generation = self.search_generation
+        for index in range(first, min(last, len(self.manga_results))):
+            if index in self.cover_requests or self.manga_listbox.has_image(index):
+                continue
+            record = self.api.entities.record_for(self.manga_results[index])
+            if not record.cover_file:
+                continue
+            
+            data = self.covers.cached(record.id, record.cover_file)
+            if data is not None:
+                self._show_cover(generation, index, data)
+            else:
+                self.cover_requests[index] = self.covers.request(
+                    record.id, record.cover_file,
+                    lambda data, index=index: self.root.after(0, self._show_cover, generation, index, data))
+    
+    def _show_cover(self, generation, index, data):
+        if generation != self.search_generation:
+            return
+        self.cover_requests.pop(index, None)
+        self.manga_listbox.set_image(index, tk.PhotoImage(data=base64.b64encode(data)))
+    
+    def _cancel_cover_requests(self):
+        for future in self.cover_requests.values():
+            future.cancel()
+        self.cover_requests = {}
+    
+    def _clear_chapter_results(self):
+        self.chapter_results = []
+        self.selected_chapter = None
+        self.chapter_listbox.clear()
+        self.chapter_count_label.configure(text="")
+        self.download_btn.configure(state=tk.DISABLED)
         self.load_all_btn.configure(state=tk.DISABLED)
-        self.status_label.configure(text=f"Found {len(results)} manga")
     
     def on_manga_select(self, event):
         selection = self.manga_listbox.curselection()
@@ -170,13 +360,8 @@ class MangaDexDownloaderGUI:
         self.selected_manga = self.manga_results[index]
         manga_id = self.selected_manga['id']
         
-        self.load_all_btn.configure(state=tk.NORMAL)
         self.status_label.configure(text="Loading ALL chapters (English only)...")
-        
-        # Load initial chapters in separate thread
-        thread = threading.Thread(target=self._load_chapters_thread, args=(manga_id,))
-        thread.daemon = True
-        thread.start()
+        self._start_chapter_load(manga_id, False)
     
     def load_all_chapters(self):
         """Load ALL chapters for the selected manga in ALL languages"""
@@ -184,64 +369,112 @@ class MangaDexDownloaderGUI:
             return
             
         manga_id = self.selected_manga['id']
-        self.load_all_btn.configure(state=tk.DISABLED)
         self.status_label.configure(text="Loading ALL chapters in ALL languages... Please wait...")
+        self._start_chapter_load(manga_id, True)
+    
+    def _start_chapter_load(self, manga_id, is_all_languages):
+        # Switching manga cancels the chapter load still running
+        self.chapter_cancel.set()
+        self.chapter_cancel = threading.Event()
+        self.chapter_generation += 1
+        
+        self._clear_chapter_results()
+        self.load_all_btn.configure(state=tk.NORMAL if not is_all_languages else tk.DISABLED)
         
-        # Load all chapters in separate thread
-        thread = threading.Thread(target=self._load_all_chapters_thread, args=(manga_id,))
+        # Load chapters in separate thread
+        thread = threading.Thread(target=self._load_chapters_thread, 
+                                  args=(manga_id, is_all_languages, self.chapter_generation, self.chapter_cancel))
         thread.daemon = True
         thread.start()
     
-    def _load_chapters_thread(self, manga_id):
-        try:
-            # Load ALL chapters (English only by default)
-            chapters = self.api.get_manga_chapters(manga_id)
-            self.chapter_results = chapters
-            
-            # Update UI in main thread
-            self.root.after(0, self._update_chapter_results, chapters, False)
-            
-        except Exception as e:
-            self.root.after(0, self._show_error, f"Failed to load chapters: {str(e)}")
+    @staticmethod
+    def _chapter_display(chapter, is_all_languages):
+        attrs = chapter.get('attributes', {})
+        display_text = format_chapter_display(attrs)
+        
+        # Add language info if multiple languages
+        if is_all_languages:
+            lang = attrs.get('translatedLanguage', 'unknown')
+            display_text += f" [{lang.upper()}]"
+        
+        # Scanlation groups tell the releases of one chapter apart
+        group_names = [name for _, name in chapter_groups(chapter) if name]
+        if group_names:
+            display_text += f" - {', '.join(group_names)}"
+        return display_text
     
-    def _load_all_chapters_thread(self, manga_id):
+    def _load_chapters_thread(self, manga_id, is_all_languages, generation, cancel_event):
+        def on_batch(batch):
+            # Called on the API event loop, hand the batch on untouched
+            self.chapter_rows.submit(self._format_chapter_batch, generation, batch, is_all_languages)
+        
         try:
-            chapters = self.api.get_all_manga_chapters(manga_id)
-            self.chapter_results = chapters
+            if is_all_languages:
+                chapters = self.api.get_all_manga_chapters_stream(manga_id, on_batch, cancel_event)
+            else:
+                # Load ALL chapters (English only by default)
+                chapters = self.api.get_manga_chapters_stream(manga_id, on_batch, cancel_event)
+            if cancel_event.is_set():
+                return
             
-            # Update UI in main thread
-            self.root.after(0, self._update_chapter_results, chapters, True)
+            # The API's chapter-string order is unreliable ("10.5", "Extra"), show reading order
+            chapters = ChapterCatalog(chapters).select()
+            displays = [self._chapter_display(chapter, is_all_languages) for chapter in chapters]
+            # Behind the batches still being formatted, so no stale rows get appended afterwards
+            self.chapter_rows.submit(self.root.after, 0, self._chapters_finished,
+                                     generation, is_all_languages, chapters, displays)
             
         except Exception as e:
-            self.root.after(0, self._show_error, f"Failed to load all chapters: {str(e)}")
-            self.root.after(0, lambda: self.load_all_btn.configure(state=tk.NORMAL))
+            if not cancel_event.is_set():
+                self.root.after(0, self._show_error, f"Failed to load chapters: {str(e)}")
     
-    def _update_chapter_results(self, chapters, is_all_languages=False):
-        self.chapter_listbox.delete(0, tk.END)
+    def _format_chapter_batch(self, generation, chapters, is_all_languages):
+        if generation != self.chapter_generation:
+            return
+        displays = [self._chapter_display(chapter, is_all_languages) for chapter in chapters]
+        self.root.after(0, self._append_chapter_results, generation, chapters, displays)
+    
+    def _append_chapter_results(self, generation, chapters, displays):
+        if generation != self.chapter_generation:
+            return
         
-        for i, chapter in enumerate(chapters):
-            attrs = chapter.get('attributes', {})
-            display_text = format_chapter_display(attrs)
-            
-            # Add language info if multiple languages
-            if is_all_languages:
-                lang = attrs.get('translatedLanguage', 'unknown')
-                display_text += f" [{lang.upper()}]"
-            
-            self.chapter_listbox.insert(tk.END, display_text)
+        self.chapter_results.extend(chapters)
+        self.chapter_listbox.extend(displays)
         
-        count_text = f"{len(chapters)} chapters loaded"
+        self.chapter_count_label.configure(text=f"{len(self.chapter_results)} chapters loaded...")
+    
+    def _chapters_finished(self, generation, is_all_languages, chapters, displays):
+        if generation != self.chapter_generation:
+            return
+        
+        # Swap in the sorted list, the rows were only appended in arrival order so far.
+        # Rows picked while the list was loading stay selected
+        selected_ids = {self.chapter_results[index]['id'] for index in self.chapter_listbox.curselection()}
+        self.chapter_results = chapters
+        self.chapter_listbox.clear()
+        self.chapter_listbox.extend(displays)
+        
+        selected = [index for index, chapter in enumerate(chapters) if chapter['id'] in selected_ids]
+        for index in selected:
+            self.chapter_listbox.selection_set(index)
+        if selected:
+            self.chapter_listbox.see(selected[0])
+        # Same rule as on_chapter_select, the first selected row is the one single downloads use
+        self.selected_chapter = chapters[selected[0]] if selected else None
+        self.download_btn.configure(state=tk.NORMAL if self.selected_chapter else tk.DISABLED)
+        
+        count_text = f"{len(self.chapter_results)} chapters loaded"
         if is_all_languages:
             count_text += " (All Languages)"
         else:
             count_text += " (English only - click button for more)"
             
         self.chapter_count_label.configure(text=count_text)
-        self.status_label.configure(text=f"Loaded {len(chapters)} chapters")
-        self.load_all_btn.configure(state=tk.NORMAL if not is_all_languages else tk.DISABLED)
+        self.status_label.configure(text=f"Loaded {len(self.chapter_results)} chapters")
     
     def on_chapter_select(self, event):
         selection = self.chapter_listbox.curselection()
+        # With several rows selected the first one is used for single downloads
         if selection:
             index = selection[0]
             self.selected_chapter = self.chapter_results[index]
@@ -263,35 +496,301 @@ class MangaDexDownloaderGUI:
         
         self.download_btn.configure(state=tk.DISABLED)
         self.progress_var.set(0)
+        self.active_download = self.selected_chapter['id']
         
         # Start download in separate thread
         thread = threading.Thread(target=self._download_thread, 
-                                args=(self.selected_chapter, manga_title, save_dir))
+                                args=(self.selected_chapter, manga_title, save_dir, self.selected_manga['id'],
+                                      self.format_var.get()))
         thread.daemon = True
         thread.start()
     
-    def _download_thread(self, chapter_data, manga_title, save_dir):
+    def _download_thread(self, chapter_data, manga_title, save_dir, manga_id=None, output_format=None):
         try:
-            def progress_callback(progress):
-                self.root.after(0, lambda: self.progress_var.set(progress))
-            
-            def status_callback(status):
-                self.root.after(0, lambda: self.status_label.configure(text=status))
-            
-            pdf_path = self.downloader.download_chapter(
-                chapter_data, manga_title, save_dir,
-                progress_callback, status_callback
+            # Progress goes through the bus under the chapter id, see _drain_progress
+            file_path = self.downloader.download_chapter(
+                chapter_data, manga_title, save_dir, manga_id=manga_id, output_format=output_format,
+                progress_bus=self.progress_bus, job_id=chapter_data['id']
             )
             
-            self.root.after(0, self._download_complete, pdf_path)
+            self.root.after(0, self._download_complete, file_path)
             
         except Exception as e:
             self.root.after(0, self._show_error, f"Download failed: {str(e)}")
     
-    def _download_complete(self, pdf_path):
+    def _download_complete(self, file_path):
         self.download_btn.configure(state=tk.NORMAL)
         self.status_label.configure(text="Download complete!")
-        messagebox.showinfo("Success", f"Chapter downloaded successfully!\nSaved to: {pdf_path}")
+        messagebox.showinfo("Success", f"Chapter downloaded successfully!\nSaved to: {file_path}")
+    
+    def toggle_data_saver(self):
+        """Let the concurrency controller switch to dataSaver below SLOW_LINK_BYTES_PER_SECOND"""
+        self.downloader.concurrency.set_data_saver_below(
+            SLOW_LINK_BYTES_PER_SECOND if self.data_saver_var.get() else None)
+
+    def merge_volume(self):
+        if not self.selected_manga:
+            messagebox.showwarning("Warning", "Please select a manga first")
+            return
+        
+        volume = self.merge_volume_entry.get().strip()
+        if not volume:
+            messagebox.showwarning("Warning", "Please enter the volume to merge")
+            return
+        
+        save_dir = filedialog.askdirectory(title="Select Directory for the Merged Volume")
+        if not save_dir:
+            return
+        
+        # Only chapters in the shown language are merged
+        language = None if self.lang_var.get() == "all" else self.lang_var.get()
+        
+        thread = threading.Thread(target=self._merge_volume_thread, 
+                                  args=(self.selected_manga, volume, save_dir, language, self.format_var.get()))
+        thread.daemon = True
+        thread.start()
+    
+    def _merge_volume_thread(self, manga, volume, save_dir, language, output_format):
+        try:
+            file_path = self.downloader.merge_volume(
+                manga['id'], volume, save_dir, self.api.get_manga_title(manga), language, output_format,
+                status_callback=lambda status: self.root.after(0, lambda: self.status_label.configure(text=status))
+            )
+            self.root.after(0, lambda: messagebox.showinfo("Success", f"Volume {volume} merged!\nSaved to: {file_path}"))
+        except Exception as e:
+            self.root.after(0, self._show_error, f"Merge failed: {str(e)}")
+    
+    def _ask_queue_save_dir(self):
+        save_dir = filedialog.askdirectory(title="Select Download Directory", 
+                                           initialdir=self.queue_save_dir)
+        if save_dir:
+            self.queue_save_dir = save_dir
+        return save_dir
+    
+    def queue_selected_chapters(self):
+        selection = self.chapter_listbox.curselection()
+        if not selection or not self.selected_manga:
+            messagebox.showwarning("Warning", "Please select one or more chapters first")
+            return
+        
+        save_dir = self._ask_queue_save_dir()
+        if not save_dir:
+            return
+        
+        chapters = [self.chapter_results[i] for i in selection]
+        jobs = self.download_queue.enqueue_chapters(
+            chapters, self.api.get_manga_title(self.selected_manga), save_dir,
+            manga_id=self.selected_manga['id'], output_format=self.format_var.get()
+        )
+        self.status_label.configure(text=f"Queued {len(jobs)} chapters")
+    
+    def _prefer_groups(self):
+        """Group names typed in the prefer-group box, comma separated"""
+        return [name.strip() for name in self.prefer_group_entry.get().split(',') if name.strip()]
+    
+    def queue_chapter_range(self):
+        if not self.selected_manga or not self.chapter_results:
+            messagebox.showwarning("Warning", "Please select a manga and load its chapters first")
+            return
+        
+        start = parse_chapter_number(self.range_start_entry.get().strip())
+        end = parse_chapter_number(self.range_end_entry.get().strip())
+        if start is None or end is None or start > end:
+            messagebox.showwarning("Warning", "Please enter a valid chapter range")
+            return
+        
+        save_dir = self._ask_queue_save_dir()
+        if not save_dir:
+            return
+        
+        jobs = self.download_queue.enqueue_range(
+            self.chapter_results, start, end, self.api.get_manga_title(self.selected_manga), save_dir,
+            manga_id=self.selected_manga['id'], output_format=self.format_var.get(),
+            prefer_groups=self._prefer_groups()
+        )
+        self.status_label.configure(text=f"Queued {len(jobs)} chapters")
+    
+    def queue_whole_manga(self):
+        if not self.selected_manga:
+            messagebox.showwarning("Warning", "Please select a manga first")
+            return
+        
+        save_dir = self._ask_queue_save_dir()
+        if not save_dir:
+            return
+        
+        manga = self.selected_manga
+        all_languages = self.lang_var.get() == "all"
+        self.status_label.configure(text="Queueing all chapters...")
+        
+        # Loading the full feed can take a while
+        thread = threading.Thread(target=self._queue_manga_thread, 
+                                  args=(manga, save_dir, all_languages, self.format_var.get(), self._prefer_groups()))
+        thread.daemon = True
+        thread.start()
+    
+    def _queue_manga_thread(self, manga, save_dir, all_languages, output_format, prefer_groups):
+        try:
+            jobs = self.download_queue.enqueue_manga(manga, save_dir, all_languages=all_languages, 
+                                                     output_format=output_format, prefer_groups=prefer_groups)
+            self.root.after(0, lambda: self.status_label.configure(text=f"Queued {len(jobs)} chapters"))
+        except Exception as e:
+            self.root.after(0, self._show_error, f"Failed to queue manga: {str(e)}")
+    
+    def follow_manga(self):
+        if not self.selected_manga:
+            messagebox.showwarning("Warning", "Please select a manga first")
+            return
+        
+        auto_download = self.follow_auto_var.get()
+        save_dir = None
+        if auto_download:
+            save_dir = self._ask_queue_save_dir()
+            if not save_dir:
+                return
+        
+        manga = self.selected_manga
+        languages = ['en'] if self.lang_var.get() == "en" else ALL_LANGUAGES
+        title = self.api.get_manga_title(manga)
+        # Following again keeps the checkpoint and only updates the settings
+        verb = "Still following" if self.watch_list.is_followed(manga['id']) else "Following"
+        self.watch_list.follow(manga['id'], title, languages, save_dir, 
+                               auto_download=auto_download, output_format=self.format_var.get())
+        outcome = "queued" if auto_download else "reported"
+        self.status_label.configure(text=f"{verb} {title}, new chapters will be {outcome}")
+    
+    def show_followed(self):
+        """List followed manga, selected ones can be unfollowed"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Followed Manga")
+        dialog.transient(self.root)
+        dialog.columnconfigure(0, weight=1)
+        dialog.rowconfigure(0, weight=1)
+        
+        columns = ('title', 'languages', 'auto')
+        tree = ttk.Treeview(dialog, columns=columns, show='headings', height=12)
+        for column, heading, width in (('title', 'Manga', 300), ('languages', 'Languages', 160),
+                                       ('auto', 'Auto-download', 100)):
+            tree.heading(column, text=heading)
+            tree.column(column, width=width, stretch=(column == 'title'))
+        tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=10, pady=(10, 5))
+        
+        def refresh():
+            tree.delete(*tree.get_children())
+            for follow in self.watch_list.get_follows():
+                tree.insert('', tk.END, iid=follow['manga_id'], values=(
+                    follow['title'], ', '.join(follow['languages']),
+                    "Yes" if follow['auto_download'] else "No"))
+        
+        def unfollow():
+            for manga_id in tree.selection():
+                self.watch_list.unfollow(manga_id)
+            refresh()
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.grid(row=1, column=0, sticky=tk.E, padx=10, pady=(0, 10))
+        ttk.Button(button_frame, text="Unfollow", command=unfollow).grid(row=0, column=0, padx=(0, 5))
+        ttk.Button(button_frame, text="Close", command=dialog.destroy).grid(row=0, column=1)
+        
+        refresh()
+    
+    def check_followed(self):
+        self.status_label.configure(text="Checking followed manga for new chapters...")
+        thread = threading.Thread(target=self._check_followed_thread)
+        thread.daemon = True
+        thread.start()
+    
+    def _check_followed_thread(self):
+        try:
+            new_chapters = self.watch_list.check()
+            total = sum(len(chapters) for chapters in new_chapters.values())
+            self.root.after(0, lambda: self.status_label.configure(
+                text=f"{total} new chapters in {len(new_chapters)} followed manga"))
+        except Exception as e:
+            self.root.after(0, self._show_error, f"Checking followed manga failed: {str(e)}")
+    
+    def _selected_queue_jobs(self):
+        return list(self.queue_tree.selection())
+    
+    def pause_queue_jobs(self):
+        for job_id in self._selected_queue_jobs():
+            self.download_queue.pause(job_id)
+    
+    def resume_queue_jobs(self):
+        for job_id in self._selected_queue_jobs():
+            self.download_queue.resume(job_id)
+    
+    def raise_queue_priority(self):
+        for job_id in self._selected_queue_jobs():
+            job = self.download_queue.get_job(job_id)
+            if job:
+                self.download_queue.set_priority(job_id, job.priority + 1)
+    
+    def remove_queue_jobs(self):
+        for job_id in self._selected_queue_jobs():
+            self.download_queue.remove(job_id)
+    
+    def export_metrics(self):
+        path = filedialog.asksaveasfilename(
+            title="Export Metrics", defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom")]
+        )
+        if not path:
+            return
+        
+        try:
+            REGISTRY.dump(path)
+            self.status_label.configure(text=f"Metrics saved to {path}")
+        except Exception as e:
+            self._show_error(f"Failed to export metrics: {str(e)}")
+    
+    def _drain_progress(self):
+        """Apply the coalesced progress of every job that reported since the last frame"""
+        for update in self.progress_bus.drain():
+            if update.job == self.active_download:
+                self.progress_var.set(update.progress)
+                self.status_label.configure(text=update.describe())
+            elif update.finished:
+                # The queue's own state change refreshes the row
+                self.queue_progress.pop(update.job, None)
+            else:
+                self.queue_progress[update.job] = update
+                if self.queue_tree.exists(update.job):
+                    self.queue_tree.set(update.job, 'status', f"{DOWNLOADING}: {update.describe()}")
+                    self.queue_tree.set(update.job, 'progress', f"{update.progress}%")
+        
+        if self.queue_dirty.is_set():
+            self._refresh_queue()
+        
+        self.root.after(PROGRESS_FRAME_MS, self._drain_progress)
+    
+    def _on_queue_change(self, job):
+        # Called from queue worker threads, never touch Tk here. Bursts of
+        # changes share one refresh on the next progress frame
+        self.queue_dirty.set()
+    
+    def _refresh_queue(self):
+        self.queue_dirty.clear()
+        jobs = self.download_queue.get_jobs()
+        
+        job_ids = {job.job_id for job in jobs}
+        for item in self.queue_tree.get_children():
+            if item not in job_ids:
+                self.queue_tree.delete(item)
+        
+        for index, job in enumerate(jobs):
+            progress, message = job.progress, job.message
+            update = self.queue_progress.get(job.job_id)
+            if update and job.status == DOWNLOADING:
+                # Live progress from the bus, the job itself only changes state
+                progress, message = update.progress, update.describe()
+            status = job.status if not message else f"{job.status}: {message}"
+            values = (job.manga_title, job.chapter_number, job.priority, status, f"{progress}%")
+            if self.queue_tree.exists(job.job_id):
+                self.queue_tree.item(job.job_id, values=values)
+                self.queue_tree.move(job.job_id, '', index)
+            else:
+                self.queue_tree.insert('', index, iid=job.job_id, values=values)
     
     def _show_error(self, message):
         self.search_btn.configure(state=tk.NORMAL)
@@ -304,6 +803,11 @@ def main():
     root = tk.Tk()
     app = MangaDexDownloaderGUI(root)
     root.mainloop()
+    app.download_queue.stop()
+    app.downloader.image_pipeline.shutdown()
+    app.covers.shutdown()
+    app.chapter_rows.shutdown(wait=False, cancel_futures=True)
+    app.api.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,144 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+class HistoryStore:
+    """Download history in SQLite, indexed by manga id and chapter id.
+
+    Each download is a single INSERT, WAL journaling keeps it safe across
+    crashes and concurrent writers. The old history.json is imported once,
+    both of its entry layouts are understood.
+    """
+
+    def __init__(self, path="history.db", legacy_json="history.json"):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY,
+                manga_id TEXT,
+                manga_title TEXT NOT NULL,
+                chapter_id TEXT,
+                chapter_number TEXT,
+                volume TEXT,
+                language TEXT,
+                file_path TEXT NOT NULL,
+                file_size INTEGER,
+                download_date TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS downloads_manga ON downloads (manga_id);
+            CREATE INDEX IF NOT EXISTS downloads_chapter ON downloads (chapter_id);
+            CREATE INDEX IF NOT EXISTS downloads_title ON downloads (manga_title);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self.db.commit()
+
+        if legacy_json:
+            self.migrate_json(legacy_json)
+
+    def add(self, manga_title, chapter_number, file_path, manga_id=None, chapter_id=None,
+            volume=None, language=None, file_size=None, download_date=None):
+        if file_size is None and os.path.exists(file_path):
+            file_size = os.path.getsize(file_path)
+
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO downloads (manga_id, manga_title, chapter_id, chapter_number, volume, language, "
+                "file_path, file_size, download_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (manga_id, manga_title, chapter_id, None if chapter_number is None else str(chapter_number),
+                 volume, language, file_path, file_size, download_date or datetime.now().isoformat())
+            )
+            self.db.commit()
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            cursor = self.db.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def downloaded_chapter_ids(self, manga_id):
+        """Ids of every chapter of this manga downloaded so far"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT DISTINCT chapter_id FROM downloads WHERE manga_id = ? AND chapter_id IS NOT NULL",
+                (manga_id,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def has_chapter(self, chapter_id):
+        with self.lock:
+            row = self.db.execute("SELECT 1 FROM downloads WHERE chapter_id = ? LIMIT 1", (chapter_id,)).fetchone()
+        return row is not None
+
+    def entries(self, manga_id=None, manga_title=None, volume=None, language=None, limit=None):
+        """History entries, newest first"""
+        sql = "SELECT * FROM downloads"
+        conditions, params = [], []
+        for column, value in (('manga_id', manga_id), ('manga_title', manga_title),
+                              ('volume', volume), ('language', language)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def migrate_json(self, legacy_json):
+        """Import the old history.json once, the file itself is left untouched"""
+        if not os.path.exists(legacy_json):
+            return 0
+
+        marker = f"migrated:{os.path.abspath(legacy_json)}"
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                return 0
+
+        try:
+            with open(legacy_json, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except Exception as e:
+            print(f"Error reading {legacy_json} for migration: {e}")
+            return 0
+
+        rows = []
+        for entry in history:
+            # Older entries used chapter/pdf_path/download_time
+            file_path = entry.get('file_path') or entry.get('pdf_path')
+            if not file_path:
+                continue
+            rows.append((
+                entry.get('manga_id'),
+                entry.get('manga_title', 'Unknown Title'),
+                entry.get('chapter_id'),
+                entry.get('chapter_number', entry.get('chapter')),
+                entry.get('volume'),
+                entry.get('language'),
+                file_path,
+                entry.get('file_size'),
+                entry.get('download_date') or entry.get('download_time') or datetime.now().isoformat()
+            ))
+
+        with self.lock:
+            with self.db:
+                self.db.executemany(
+                    "INSERT INTO downloads (manga_id, manga_title, chapter_id, chapter_number, volume, language, "
+                    "file_path, file_size, download_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                self.db.execute("INSERT INTO meta VALUES (?, ?)", (marker, datetime.now().isoformat()))
+
+        print(f"Migrated {len(rows)} history entries from {legacy_json}")
+        return len(rows)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
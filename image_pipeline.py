@@ -0,0 +1,129 @@
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from PIL import Image
+from metrics import IMAGE_CONVERT
+from pdf_writer import JPEG_MAGIC, PNG_MAGIC
+
+def page_needs_conversion(page_data):
+    """Check if a page can't be embedded in the PDF as-is"""
+    if page_data.startswith(JPEG_MAGIC):
+        return False
+
+    if page_data.startswith(PNG_MAGIC) and len(page_data) >= 29:
+        # IHDR layout: bit depth at byte 24, color type at 25, interlace at 28
+        color_type = page_data[25]
+        interlace = page_data[28]
+        # 0 = grayscale, 2 = RGB; palette (3) and alpha (4, 6) need converting
+        return color_type not in (0, 2) or interlace != 0
+
+    # WEBP, GIF and anything else goes through PIL
+    return True
+
+def prepare_page(page_data):
+    """Return page bytes ready for the PDF, only decoding when really needed"""
+    if not page_needs_conversion(page_data):
+        return page_data
+
+    img = Image.open(io.BytesIO(page_data))
+    # Convert to RGB if necessary
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    output = io.BytesIO()
+    img.save(output, 'JPEG', quality=95)
+    return output.getvalue()
+
+def convert_page_file(path):
+    """Runs in a worker process: write a PDF-ready copy of a staged page, returns its path"""
+    with open(path, 'rb') as f:
+        page_data = f.read()
+
+    converted_path = path + ".converted.jpg"
+    with open(converted_path, 'wb') as f:
+        f.write(prepare_page(page_data))
+    return converted_path
+
+class ImagePipeline:
+    """CPU stage that turns staged pages into PDF-ready files in a process pool.
+
+    Pages that can be embedded as-is skip the pool entirely. The number of
+    pages waiting for or in conversion is capped, submit() blocks the calling
+    download thread once the cap is reached so a fast network can't pile up
+    work faster than the CPUs clear it. One pipeline is shared by every
+    chapter a downloader is working on.
+
+    Workers are spawned, never forked from this process: by the time pages
+    arrive it runs the API event loop, Tk and the download threads, and a
+    fork could copy one of their held locks into the child. Call start()
+    from the main thread at startup, otherwise the pool is created on first
+    use.
+    """
+
+    def __init__(self, processes=None, max_pending=None):
+        # processes=0 converts inline on the calling thread
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.max_pending = max_pending or max(1, self.processes) * 4
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Create the process pool now instead of on the first page that needs it"""
+        self._get_executor()
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None and self.processes:
+                try:
+                    self.executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                        mp_context=multiprocessing.get_context('spawn'))
+                except (OSError, NotImplementedError) as e:
+                    print(f"Process pool unavailable, converting pages inline: {e}")
+                    self.processes = 0
+            return self.executor
+
+    def submit(self, path):
+        """Queue a staged page, returns a future for the path of its PDF-ready file"""
+        with open(path, 'rb') as f:
+            header = f.read(32)
+
+        if not page_needs_conversion(header):
+            future = Future()
+            future.set_result(path)
+            return future
+
+        executor = self._get_executor()
+        if executor is None:
+            future = Future()
+            try:
+                with IMAGE_CONVERT.time(mode='inline'):
+                    future.set_result(convert_page_file(path))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        # Backpressure: wait here while the CPU stage is full
+        self.slots.acquire()
+        start = time.perf_counter()
+        try:
+            future = executor.submit(convert_page_file, path)
+        except Exception:
+            self.slots.release()
+            raise
+
+        def done(_):
+            self.slots.release()
+            IMAGE_CONVERT.observe(time.perf_counter() - start, mode='pool')
+
+        future.add_done_callback(done)
+        return future
+
+    def shutdown(self, wait=False):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=wait, cancel_futures=True)
+                self.executor = None
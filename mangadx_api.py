@@ -1,240 +1,779 @@
-import requests
+import asyncio
+import hashlib
+import json
+import os
+import string
+import threading
 import time
+from datetime import timedelta
+from urllib.parse import urlparse
+import aiohttp
+from chapter_store import ChapterStore
+from metadata import EntityCache, localized
+from metrics import REGISTRY, API_LATENCY, API_RETRIES, RATE_LIMIT_WAIT, endpoint_label
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+from utils import parse_chapter_number
 
-class MangaDexAPI:
+# Languages of the "all languages" views, also their preference order
+ALL_LANGUAGES = ['en', 'id', 'ja', 'es', 'fr', 'de', 'ru']
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def _get_event_loop():
+    """Return the background event loop shared by every synchronous client"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="mangadex-api-loop", daemon=True)
+            thread.start()
+        return _loop
+
+def _encode_params(params):
+    """Flatten query params into (key, value) pairs - lists become repeated keys"""
+    pairs = []
+    for key, value in (params or {}).items():
+        if isinstance(value, (list, tuple)):
+            pairs.extend((key, str(item)) for item in value)
+        else:
+            pairs.append((key, str(value)))
+    return pairs
+
+def get_manga_title(manga_data):
+    """Extract manga title from manga data"""
+    # English title first, else the first available one
+    return localized(manga_data.get('attributes', {}).get('title'), "Unknown Title")
+
+def _chapter_sort_key(chapter):
+    """Numeric chapter order, chapters without a number go last"""
+    number = parse_chapter_number(chapter.get('attributes', {}).get('chapter'))
+    return (number is None, number or 0)
+
+def _has_content(chapter):
+    """Accept almost all chapters.
+
+    Only exclude if explicitly marked as 0 pages AND has no external URL.
+    """
+    attrs = chapter.get('attributes', {})
+    return attrs.get('pages') != 0 or bool(attrs.get('externalUrl'))
+
+def build_page_url(server, index, data_saver=False):
+    """Page URL on an at-home node, dataSaver pages live under /data-saver"""
+    if data_saver:
+        return f"{server['base_url']}/data-saver/{server['hash']}/{server['data_saver'][index]}"
+    return f"{server['base_url']}/data/{server['hash']}/{server['data'][index]}"
+
+def build_cover_url(covers_url, manga_id, file_name, size=256):
+    """Cover image URL, size 256 or 512 picks the small .{size}.jpg variant, None the original"""
+    suffix = f".{size}.jpg" if size else ""
+    return f"{covers_url}/{manga_id}/{file_name}{suffix}"
+
+def page_hash_prefix(url):
+    """SHA-256 prefix at-home embeds in page filenames ({n}-{sha256}.{ext}), None if absent"""
+    stem = url.rsplit('/', 1)[-1].split('?', 1)[0].rsplit('.', 1)[0]
+    prefix = stem.rsplit('-', 1)[-1].lower()
+    if len(prefix) >= 8 and all(c in string.hexdigits for c in prefix):
+        return prefix
+    return None
+
+class PageIntegrityError(Exception):
+    """A page body that doesn't match its Content-Length or filename hash"""
+
+class AsyncMangaDexAPI:
     BASE_URL = "https://api.mangadex.org"
-    
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'MangaDex Downloader/1.0'
-        })
-    
-    def search_manga(self, title, get_all=True):
+    COVERS_URL = "https://uploads.mangadex.org/covers"
+    USER_AGENT = 'MangaDex Downloader/1.0'
+
+    # Highest offset + limit the API accepts on paginated lists
+    MAX_RESULTS = 10000
+
+    # Statuses worth retrying, everything else fails right away
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    # Manga ids per batched /chapter query, keeps the URL at a sane length
+    MANGA_IDS_PER_QUERY = 100
+
+    # Bulk lookups by ids[], the list endpoints return at most 100 per request
+    IDS_PER_QUERY = 100
+    ENTITY_ENDPOINTS = {
+        'manga': '/manga',
+        'chapter': '/chapter',
+        'scanlation_group': '/group',
+        'author': '/author'
+    }
+
+    def __init__(self, base_url=None, max_connections=32, max_connections_per_host=16, rate_limiter=None,
+                 cache=None, chapter_store=None, min_sync_interval=60, entities=None, covers_url=None):
+        self.base_url = (base_url or self.BASE_URL).rstrip('/')
+        self.covers_url = (covers_url or self.COVERS_URL).rstrip('/')
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.rate_limiter = rate_limiter or RateLimiter(self.base_url, covers_url=self.covers_url)
+
+        # Pass cache=False to always hit the network
+        if cache is None:
+            cache = ResponseCache()
+        self.cache = cache or None
+
+        # Local chapter feeds for incremental sync, chapter_store=False disables it
+        if chapter_store is None:
+            chapter_store = ChapterStore()
+        self.chapter_store = chapter_store or None
+        # A feed synced this recently (seconds) is served from the store as-is
+        self.min_sync_interval = min_sync_interval
+
+        # Normalized manga/chapter/group/author records seen in any response
+        self.entities = entities or EntityCache()
+
+        self.session = None
+
+        REGISTRY.register_collector('api_cache', self._collect_metrics)
+
+    def _collect_metrics(self):
+        stats = self.cache_stats()
+        return {f"cache_{name}": value for name, value in stats.items()}
+
+    async def _get_session(self):
+        """Create the shared keep-alive session on first use"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=30
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'User-Agent': self.USER_AGENT}
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        if self.cache:
+            await asyncio.get_running_loop().run_in_executor(None, self.cache.flush)
+
+    def cache_stats(self):
+        """Hit/miss counters of the response cache"""
+        return self.cache.stats() if self.cache else {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _request(self, url, params=None, timeout=30, retries=4, as_json=True, use_cache=True):
+        """GET through the cache and rate limiter, retrying 429/5xx and network errors with backoff"""
+        query = _encode_params(params)
+
+        # JSON responses of cacheable endpoints may not need the network at all.
+        # Cache I/O is blocking SQLite, it runs in the default executor
+        loop = asyncio.get_running_loop()
+        cache_key = cache_ttl = cached = None
+        headers = {}
+        if as_json and self.cache:
+            cache_ttl = self.cache.ttl_for(url)
+        if cache_ttl:
+            cache_key = self.cache.make_key(url, query)
+            cached = await loop.run_in_executor(None, self.cache.get, cache_key) if use_cache else None
+            if cached and cached['fresh']:
+                return json.loads(cached['body'])
+            if cached and cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached and cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        session = await self._get_session()
+        bucket = self.rate_limiter.bucket_for(url)
+        # Page and cover fetches are grouped together, API calls by endpoint with ids collapsed
+        endpoint = bucket if bucket in ('at-home', 'covers') else endpoint_label(urlparse(url).path)
+
+        for attempt in range(retries):
+            with RATE_LIMIT_WAIT.time(bucket=bucket):
+                await self.rate_limiter.acquire(bucket)
+            start = time.perf_counter()
+            try:
+                async with session.get(url, params=query, headers=headers,
+                                       timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    API_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, status=response.status)
+                    retry_after = self.rate_limiter.update(bucket, response.status, response.headers)
+
+                    if response.status == 304 and cached:
+                        await loop.run_in_executor(None, self.cache.revalidated, cache_key)
+                        return json.loads(cached['body'])
+
+                    if response.status in self.RETRY_STATUSES and attempt < retries - 1:
+                        print(f"Got HTTP {response.status} for {url}, retrying...")
+                        API_RETRIES.inc(endpoint=endpoint, reason=response.status)
+                        # The bucket is already blocked when the server told us how long to wait
+                        if not retry_after:
+                            await asyncio.sleep(self.rate_limiter.backoff_delay(attempt))
+                        continue
+
+                    response.raise_for_status()
+                    body = await response.read()
+                    if not as_json:
+                        return body
+
+                    if cache_key:
+                        await loop.run_in_executor(None, self.cache.put, cache_key, body, cache_ttl,
+                                                   response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                    return json.loads(body)
+
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                if attempt >= retries - 1:
+                    raise
+                print(f"Attempt {attempt + 1} failed for {url}: {e}")
+                API_RETRIES.inc(endpoint=endpoint, reason=type(e).__name__)
+                await asyncio.sleep(self.rate_limiter.backoff_delay(attempt))
+
+    async def _get_json(self, url, params=None, timeout=30, use_cache=True):
+        return await self._request(url, params, timeout=timeout, use_cache=use_cache)
+
+    async def _get_bytes(self, url, timeout=30, retries=4):
+        return await self._request(url, timeout=timeout, retries=retries, as_json=False)
+
+    async def _iter_paginate(self, url, params, limit, max_items=None, use_cache=True, strict=False):
+        """Yield every page of a paginated endpoint as a list of items.
+
+        The first response tells us the total, the remaining offsets are then
+        requested concurrently (the rate limiter keeps them within budget).
+        Batches are yielded in offset order as soon as each one lands, and
+        closing the generator early cancels the requests still in flight.
+        A failed page ends the results there, or raises when strict is set.
+        """
+        first = await self._get_json(url, dict(params, limit=limit, offset=0), use_cache=use_cache)
+        items = first.get('data', [])
+        self.entities.absorb(items)
+        if items:
+            yield items
+
+        # The API refuses offset + limit past 10000
+        total = min(first.get('total', 0), self.MAX_RESULTS)
+        if max_items:
+            total = min(total, max_items)
+
+        if len(items) < limit or len(items) >= total:
+            return
+
+        tasks = [
+            asyncio.ensure_future(self._get_json(url, dict(params, limit=limit, offset=offset), use_cache=use_cache))
+            for offset in range(limit, total, limit)
+        ]
+        try:
+            for task in tasks:
+                try:
+                    page = await task
+                except Exception as e:
+                    if strict:
+                        raise
+                    # Stop at the first failed page so the results stay contiguous
+                    print(f"Error loading {url}: {e}")
+                    return
+                items = page.get('data', [])
+                self.entities.absorb(items)
+                yield items
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _paginate(self, url, params, limit, max_items=None, use_cache=True, strict=False):
+        """Fetch every page of a paginated endpoint, merged in offset order"""
+        items = []
+        async for batch in self._iter_paginate(url, params, limit, max_items, use_cache, strict):
+            items.extend(batch)
+        return items
+
+    def _search_params(self, title):
+        return {
+            'title': title,
+            'includes[]': ['cover_art', 'author', 'artist'],
+            'availableTranslatedLanguage[]': ['en'],  # Bisa ditambah bahasa lain
+            'status[]': ['ongoing', 'completed', 'hiatus', 'cancelled'],
+            'contentRating[]': ['safe', 'suggestive', 'erotica']
+        }
+
+    async def iter_search_manga(self, title):
+        """Search manga by title, yielding each batch of results as it arrives"""
+        url = f"{self.base_url}/manga"
+        async for batch in self._iter_paginate(url, self._search_params(title), limit=100):
+            yield batch
+
+    async def search_manga(self, title, get_all=True):
         """Search manga by title - get ALL results"""
         all_manga = []
-        
+
         try:
-            offset = 0
-            limit = 100  # Max allowed by API
-            
-            while True:
-                url = f"{self.BASE_URL}/manga"
-                params = {
-                    'title': title,
-                    'limit': limit,
-                    'offset': offset,
-                    'includes[]': ['cover_art', 'author', 'artist'],
-                    'availableTranslatedLanguage[]': ['en'],  # Bisa ditambah bahasa lain
-                    'status[]': ['ongoing', 'completed', 'hiatus', 'cancelled'],
-                    'contentRating[]': ['safe', 'suggestive', 'erotica']
-                }
-                
-                response = self.session.get(url, params=params)
-                response.raise_for_status()
-                
-                data = response.json()
-                manga_batch = data.get('data', [])
-                
-                if not manga_batch:
-                    break
-                
-                all_manga.extend(manga_batch)
-                
-                # Check if we've got everything
-                total = data.get('total', 0)
-                if len(all_manga) >= total or len(manga_batch) < limit:
-                    break
-                
-                offset += len(manga_batch)
-                
-                # Rate limiting
-                time.sleep(0.1)
-                
-                # Don't get stuck in infinite loop
-                if offset > 10000:  # Safety limit
-                    print(f"Reached safety limit, got {len(all_manga)} manga")
-                    break
-            
+            url = f"{self.base_url}/manga"
+            all_manga = await self._paginate(url, self._search_params(title), limit=100)  # Max allowed by API
+
             print(f"Found {len(all_manga)} manga total for '{title}'")
             return all_manga
-            
+
         except Exception as e:
             print(f"Error searching manga: {e}")
             return all_manga  # Return what we have
-    
-    def get_manga_chapters(self, manga_id, get_all=True):
+
+    def _feed_params(self, languages, extra_params=None):
+        params = {
+            'order[chapter]': 'asc',
+            'translatedLanguage[]': languages,
+            'contentRating[]': ['safe', 'suggestive', 'erotica', 'pornographic'],
+            # Group names come along, needed to tell releases of a chapter apart
+            'includes[]': ['scanlation_group']
+        }
+        params.update(extra_params or {})
+        # None in extra_params removes a default param
+        return {key: value for key, value in params.items() if value is not None}
+
+    async def _fetch_feed(self, manga_id, languages, extra_params=None, safety_limit=None, use_cache=True,
+                          strict=False):
+        """Page through /manga/{id}/feed and return every chapter it lists"""
+        url = f"{self.base_url}/manga/{manga_id}/feed"
+        params = self._feed_params(languages, extra_params)
+
+        all_chapters = await self._paginate(url, params, limit=500, max_items=safety_limit,  # Max allowed by API
+                                            use_cache=use_cache, strict=strict)
+
+        print(f"Loaded {len(all_chapters)} chapters")
+        return all_chapters
+
+    async def _feed_total(self, manga_id, languages):
+        """Number of chapters the feed currently lists, costs a single tiny request"""
+        url = f"{self.base_url}/manga/{manga_id}/feed"
+        params = {
+            'limit': 1,
+            'translatedLanguage[]': languages,
+            'contentRating[]': ['safe', 'suggestive', 'erotica', 'pornographic']
+        }
+        data = await self._get_json(url, params, use_cache=False)
+        return data.get('total', 0)
+
+    async def sync_manga_chapters(self, manga_id, languages, safety_limit=None):
+        """Bring the stored feed of a manga up to date and return its chapters.
+
+        The first call fetches the whole feed. After that only chapters
+        updated since the last sync are requested and merged in, plus one
+        count request to notice deleted chapters (which triggers a full
+        refetch). A failed feed page is never stored as synced: the stored
+        feed is returned as it was, or the error raised when there is none.
+        """
+        if not self.chapter_store:
+            return await self._fetch_feed(manga_id, languages, safety_limit=safety_limit)
+
+        record = self.chapter_store.load(manga_id, languages)
+        sync_started = self.chapter_store.timestamp()
+
+        if record and self.chapter_store.seconds_since(record['last_sync']) < self.min_sync_interval:
+            return sorted(record['chapters'].values(), key=_chapter_sort_key)
+
+        try:
+            if record:
+                # Overlap the window a little so chapters indexed late aren't missed
+                since = self.chapter_store.parse(record['last_sync']) - timedelta(minutes=5)
+                updates = await self._fetch_feed(manga_id, languages, {
+                    'updatedAtSince': self.chapter_store.timestamp(since),
+                    'order[chapter]': None,
+                    'order[updatedAt]': 'asc'
+                }, use_cache=False, strict=True)
+
+                chapters = record['chapters']
+                for chapter in updates:
+                    chapters[chapter['id']] = chapter
+
+                total = await self._feed_total(manga_id, languages)
+                if total != len(chapters):
+                    # Chapters were deleted (or moved out of this feed), start over
+                    print(f"Stored feed has {len(chapters)} chapters but API lists {total}, refetching...")
+                    chapters = None
+                else:
+                    print(f"Synced {len(updates)} new or updated chapters")
+            else:
+                chapters = None
+
+            if chapters is None:
+                full_feed = await self._fetch_feed(manga_id, languages, safety_limit=safety_limit, use_cache=False,
+                                                   strict=True)
+                chapters = {chapter['id']: chapter for chapter in full_feed}
+        except Exception as e:
+            if not record:
+                raise
+            # Keep serving the stored feed, last_sync stays put so the next call retries
+            print(f"Error syncing chapters of {manga_id}: {e}")
+            return sorted(record['chapters'].values(), key=_chapter_sort_key)
+
+        self.chapter_store.save(manga_id, languages, chapters, sync_started)
+
+        return sorted(chapters.values(), key=_chapter_sort_key)
+
+    async def iter_manga_chapters(self, manga_id, languages, safety_limit=None, skip_empty=False):
+        """Yield a manga's chapters in batches as they arrive.
+
+        A feed already in the chapter store is synced (one or two requests)
+        and comes back as a single batch. Otherwise every feed page is
+        yielded as it lands and the feed is stored at the end, unless a page
+        failed: then the batches so far are all there is and nothing is
+        stored, so the next call fetches the whole feed again.
+        """
+        def keep(batch):
+            return [chapter for chapter in batch if not skip_empty or _has_content(chapter)]
+
+        if self.chapter_store and self.chapter_store.load(manga_id, languages):
+            yield keep(await self.sync_manga_chapters(manga_id, languages, safety_limit))
+            return
+
+        sync_started = self.chapter_store.timestamp() if self.chapter_store else None
+        url = f"{self.base_url}/manga/{manga_id}/feed"
+        chapters = {}
+
+        try:
+            async for batch in self._iter_paginate(url, self._feed_params(languages), limit=500,
+                                                   max_items=safety_limit, use_cache=not self.chapter_store,
+                                                   strict=True):
+                for chapter in batch:
+                    chapters[chapter['id']] = chapter
+                yield keep(batch)
+        except Exception as e:
+            if not chapters:
+                raise
+            print(f"Error loading chapters of {manga_id}: {e}")
+            return
+
+        if self.chapter_store:
+            self.chapter_store.save(manga_id, languages, chapters, sync_started)
+
+    async def get_manga_chapters(self, manga_id, get_all=True):
         """Get ALL chapters for a manga - no limits"""
         all_chapters = []
-        
+
         try:
-            offset = 0
-            limit = 500  # Max allowed by API
-            
             print(f"Loading chapters for manga {manga_id}...")
-            
-            while True:
-                url = f"{self.BASE_URL}/manga/{manga_id}/feed"
-                params = {
-                    'limit': limit,
-                    'offset': offset,
-                    'order[chapter]': 'asc',
-                    'translatedLanguage[]': ['en'],  # Bisa ditambah: ['en', 'id', 'ja', 'es', 'fr']
-                    'contentRating[]': ['safe', 'suggestive', 'erotica', 'pornographic']
-                }
-                
-                response = self.session.get(url, params=params)
-                response.raise_for_status()
-                
-                data = response.json()
-                chapters = data.get('data', [])
-                
-                if not chapters:
-                    break
-                
-                # Filter chapters - very permissive
-                for chapter in chapters:
-                    attrs = chapter.get('attributes', {})
-                    pages = attrs.get('pages')
-                    
-                    # Accept almost all chapters
-                    # Only exclude if explicitly marked as 0 pages AND has no external URL
-                    if pages != 0 or attrs.get('externalUrl'):
-                        all_chapters.append(chapter)
-                
-                print(f"Loaded {len(all_chapters)} chapters so far...")
-                
-                # Check if we're done
-                total = data.get('total', 0)
-                offset += len(chapters)
-                
-                if offset >= total or len(chapters) < limit:
-                    break
-                    
-                # Rate limiting
-                time.sleep(0.2)
-                
-                # Safety limit to prevent infinite loops
-                if len(all_chapters) > 5000:
-                    print(f"Reached safety limit of 5000 chapters")
-                    break
-            
+
+            # Bisa ditambah: ['en', 'id', 'ja', 'es', 'fr']
+            chapters = await self.sync_manga_chapters(manga_id, ['en'], safety_limit=5000)
+
+            # Filter chapters - very permissive
+            all_chapters = [chapter for chapter in chapters if _has_content(chapter)]
+
             print(f"Total chapters loaded: {len(all_chapters)}")
             return all_chapters
-            
+
         except Exception as e:
             print(f"Error getting chapters: {e}")
             return all_chapters
-    
-    def get_all_manga_chapters(self, manga_id, languages=['en', 'id', 'ja', 'es', 'fr', 'de', 'ru']):
+
+    async def get_all_manga_chapters(self, manga_id, languages=ALL_LANGUAGES):
         """Get ALL chapters for a manga in multiple languages - UNLIMITED"""
         all_chapters = []
-        
+
         try:
-            offset = 0
-            limit = 500
-            
             print(f"Loading ALL chapters (all languages) for manga {manga_id}...")
-            
-            while True:
-                url = f"{self.BASE_URL}/manga/{manga_id}/feed"
-                params = {
-                    'limit': limit,
-                    'offset': offset,
-                    'order[chapter]': 'asc',
-                    'translatedLanguage[]': languages,  # Multiple languages
-                    'contentRating[]': ['safe', 'suggestive', 'erotica', 'pornographic']
-                }
-                
-                response = self.session.get(url, params=params)
-                response.raise_for_status()
-                
-                data = response.json()
-                chapters = data.get('data', [])
-                
-                if not chapters:
-                    break
-                
-                # Accept ALL chapters regardless of page count
-                all_chapters.extend(chapters)
-                
-                print(f"Loaded {len(all_chapters)} chapters so far...")
-                
-                # Check if we're done
-                total = data.get('total', 0)
-                offset += len(chapters)
-                
-                if offset >= total or len(chapters) < limit:
-                    break
-                    
-                # Longer delay for more intensive requests
-                time.sleep(0.3)
-                
-                # Higher safety limit for multi-language
-                if len(all_chapters) > 10000:
-                    print(f"Reached safety limit of 10,000 chapters")
-                    break
-            
+
+            # Accept ALL chapters regardless of page count
+            all_chapters = await self.sync_manga_chapters(manga_id, languages, safety_limit=10000)
+
             print(f"Total chapters loaded (all languages): {len(all_chapters)}")
             return all_chapters
-            
+
         except Exception as e:
             print(f"Error getting all chapters: {e}")
             return all_chapters
-    
-    def get_chapter_pages(self, chapter_id):
-        """Get page URLs for a chapter"""
+
+    async def get_manga_updates(self, manga_ids, languages, updated_since, skip_empty=True):
+        """Chapters updated since a time for many manga at once, via batched /chapter queries.
+
+        Up to MANGA_IDS_PER_QUERY manga share one query, so a long follow list
+        costs a handful of requests. Returns a dict of manga id -> chapters in
+        readableAt order. Any failed request raises, a partial answer would
+        let the caller skip chapters it never saw.
+        """
+        url = f"{self.base_url}/chapter"
+        manga_ids = list(dict.fromkeys(manga_ids))
+        updates = {manga_id: [] for manga_id in manga_ids}
+
+        async def fetch_group(group):
+            params = self._feed_params(languages, {
+                'manga[]': group,
+                'updatedAtSince': updated_since,
+                'order[chapter]': None,
+                'order[readableAt]': 'asc'
+            })
+            # /chapter allows at most 100 per page
+            return await self._paginate(url, params, limit=100, use_cache=False, strict=True)
+
+        groups = [manga_ids[start:start + self.MANGA_IDS_PER_QUERY]
+                  for start in range(0, len(manga_ids), self.MANGA_IDS_PER_QUERY)]
+        for chapters in await asyncio.gather(*(fetch_group(group) for group in groups)):
+            for chapter in chapters:
+                if skip_empty and not _has_content(chapter):
+                    continue
+                for relationship in chapter.get('relationships', []):
+                    if relationship.get('type') == 'manga' and relationship.get('id') in updates:
+                        updates[relationship['id']].append(chapter)
+
+        return updates
+
+    async def resolve(self, kind, ids):
+        """Records for a list of ids of one entity kind, as a dict of id -> record.
+
+        Ids already in the entity cache cost nothing, the rest are fetched
+        through the bulk ids[] endpoint, IDS_PER_QUERY at a time. Ids the API
+        doesn't know are left out.
+        """
+        ids = list(dict.fromkeys(entity_id for entity_id in ids if entity_id))
+        missing = self.entities.missing(kind, ids)
+        url = f"{self.base_url}{self.ENTITY_ENDPOINTS[kind]}"
+
+        async def fetch(group):
+            params = {'ids[]': group, 'limit': len(group)}
+            if kind in ('manga', 'chapter'):
+                params['contentRating[]'] = ['safe', 'suggestive', 'erotica', 'pornographic']
+            if kind == 'manga':
+                params['includes[]'] = ['cover_art']
+            data = await self._get_json(url, params)
+            self.entities.absorb(data.get('data', []))
+
+        await asyncio.gather(*(fetch(missing[start:start + self.IDS_PER_QUERY])
+                               for start in range(0, len(missing), self.IDS_PER_QUERY)))
+
+        records = {}
+        for entity_id in ids:
+            record = self.entities.get(kind, entity_id)
+            if record is not None:
+                records[entity_id] = record
+        return records
+
+    async def get_chapter_server(self, chapter_id, use_cache=True):
+        """Ask /at-home/server for a node serving this chapter.
+
+        Every uncached call may hand out a different node, so calling it with
+        use_cache=False is how a slow or dead node gets replaced.
+        """
         try:
-            # First get the server info
-            url = f"{self.BASE_URL}/at-home/server/{chapter_id}"
-            response = self.session.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            base_url = data.get('baseUrl')
-            chapter_hash = data.get('chapter', {}).get('hash')
-            pages = data.get('chapter', {}).get('data', [])
-            
-            if not all([base_url, chapter_hash, pages]):
-                return []
-            
-            # Construct page URLs
-            page_urls = []
-            for page in pages:
-                page_url = f"{base_url}/data/{chapter_hash}/{page}"
-                page_urls.append(page_url)
-            
-            return page_urls
-            
+            url = f"{self.base_url}/at-home/server/{chapter_id}"
+            data = await self._get_json(url, use_cache=use_cache)
+
+            chapter = data.get('chapter', {})
+            server = {
+                'base_url': data.get('baseUrl'),
+                'hash': chapter.get('hash'),
+                'data': chapter.get('data', []),
+                'data_saver': chapter.get('dataSaver', [])
+            }
+
+            if not all([server['base_url'], server['hash'], server['data']]):
+                return None
+
+            return server
+
         except Exception as e:
-            print(f"Error getting chapter pages: {e}")
-            return []
-    
-    def download_page(self, url, timeout=30, retries=3):
-        """Download a single page with retry logic"""
+            print(f"Error getting chapter server: {e}")
+            return None
+
+    async def _stream_page(self, url, sink, timeout=30, retries=3, chunk_size=65536, write_size=1024 * 1024):
+        """Stream a page into a writable, seekable sink, returns the byte count.
+
+        The body is hashed while it is written and checked against
+        Content-Length and the SHA-256 prefix in the page filename. Short or
+        corrupt bodies are retried like 5xx responses, the sink is rewound
+        before every attempt. Writes go to the default executor in blocks of
+        up to write_size bytes, a slow disk never blocks the event loop; the
+        next block keeps arriving while the previous one is written.
+        """
+        expected_hash = page_hash_prefix(url)
+        session = await self._get_session()
+        bucket = self.rate_limiter.bucket_for(url)
+        loop = asyncio.get_running_loop()
+
+        def rewind():
+            sink.seek(0)
+            sink.truncate()
+
         for attempt in range(retries):
+            with RATE_LIMIT_WAIT.time(bucket=bucket):
+                await self.rate_limiter.acquire(bucket)
+            start = time.perf_counter()
+            await loop.run_in_executor(None, rewind)
+            writing = None
             try:
-                response = self.session.get(url, timeout=timeout)
-                response.raise_for_status()
-                return response.content
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed for page {url}: {e}")
-                if attempt < retries - 1:
-                    time.sleep(1)  # Wait before retry
-                else:
-                    return None
-    
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    API_LATENCY.observe(time.perf_counter() - start, endpoint='at-home', status=response.status)
+                    retry_after = self.rate_limiter.update(bucket, response.status, response.headers)
+
+                    if response.status in self.RETRY_STATUSES and attempt < retries - 1:
+                        print(f"Got HTTP {response.status} for {url}, retrying...")
+                        API_RETRIES.inc(endpoint='at-home', reason=response.status)
+                        if not retry_after:
+                            await asyncio.sleep(self.rate_limiter.backoff_delay(attempt))
+                        continue
+
+                    response.raise_for_status()
+                    # Content-Length counts encoded bytes, only comparable without Content-Encoding
+                    expected_size = None if response.headers.get('Content-Encoding') else response.content_length
+
+                    digest = hashlib.sha256()
+                    size = 0
+                    block = []
+                    block_size = 0
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        block.append(chunk)
+                        block_size += len(chunk)
+                        if block_size >= write_size:
+                            if writing:
+                                await writing
+                            writing = loop.run_in_executor(None, sink.write, b''.join(block))
+                            block = []
+                            block_size = 0
+
+                    if writing:
+                        await writing
+                    writing = None
+                    if block:
+                        await loop.run_in_executor(None, sink.write, b''.join(block))
+
+                if expected_size is not None and size != expected_size:
+                    raise PageIntegrityError(f"got {size} of {expected_size} bytes")
+                if expected_hash and not digest.hexdigest().startswith(expected_hash):
+                    raise PageIntegrityError("SHA-256 does not match the filename")
+                return size
+
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError,
+                    PageIntegrityError) as e:
+                if attempt >= retries - 1:
+                    raise
+                print(f"Attempt {attempt + 1} failed for {url}: {e}")
+                API_RETRIES.inc(endpoint='at-home', reason=type(e).__name__)
+                await asyncio.sleep(self.rate_limiter.backoff_delay(attempt))
+            finally:
+                if writing:
+                    # Never rewind or close the sink under a block that is still being written
+                    await asyncio.gather(writing, return_exceptions=True)
+
+    async def download_page_to(self, url, path, timeout=30, retries=3):
+        """Stream a verified page to path, returns its size or None on failure.
+
+        Only a chunk is held in memory at a time. A failed download leaves no
+        file behind.
+        """
+        try:
+            with open(path, 'wb') as f:
+                return await self._stream_page(url, f, timeout, retries)
+        except Exception as e:
+            print(f"Failed to download page {url}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    async def download_cover(self, manga_id, file_name, size=256, timeout=30, retries=2):
+        """Download a cover image (the small .256.jpg variant by default), None on failure"""
+        try:
+            url = build_cover_url(self.covers_url, manga_id, file_name, size)
+            return await self._get_bytes(url, timeout=timeout, retries=retries)
+        except Exception as e:
+            print(f"Failed to download cover of {manga_id}: {e}")
+            return None
+
+    def get_manga_title(self, manga_data):
+        """Extract manga title from manga data, parsed once per manga"""
+        if manga_data.get('type') != 'manga' or 'id' not in manga_data:
+            return get_manga_title(manga_data)
+        return self.entities.record_for(manga_data).title
+
+class MangaDexAPI:
+    """Blocking wrapper around AsyncMangaDexAPI for threads and the GUI"""
+    BASE_URL = AsyncMangaDexAPI.BASE_URL
+
+    def __init__(self, base_url=None, client=None):
+        self.client = client or AsyncMangaDexAPI(base_url)
+        self.loop = _get_event_loop()
+
+    def _run(self, coro):
+        """Run a coroutine on the shared event loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def close(self):
+        self._run(self.client.close())
+
+    def search_manga(self, title, get_all=True):
+        """Search manga by title - get ALL results"""
+        return self._run(self.client.search_manga(title, get_all))
+
+    def get_manga_chapters(self, manga_id, get_all=True):
+        """Get ALL chapters for a manga - no limits"""
+        return self._run(self.client.get_manga_chapters(manga_id, get_all))
+
+    def get_all_manga_chapters(self, manga_id, languages=ALL_LANGUAGES):
+        """Get ALL chapters for a manga in multiple languages - UNLIMITED"""
+        return self._run(self.client.get_all_manga_chapters(manga_id, languages))
+
+    def _stream(self, batches, on_batch, cancel_event=None):
+        """Feed each batch of an async generator to on_batch, returns everything received.
+
+        on_batch runs on the event loop thread and should return quickly.
+        Setting cancel_event stops the stream and its pending requests.
+        """
+        async def consume():
+            items = []
+            try:
+                async for batch in batches:
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    items.extend(batch)
+                    on_batch(batch)
+            finally:
+                await batches.aclose()
+            return items
+
+        return self._run(consume())
+
+    def search_manga_stream(self, title, on_batch, cancel_event=None):
+        """Search manga by title, calling on_batch with each batch of results"""
+        return self._stream(self.client.iter_search_manga(title), on_batch, cancel_event)
+
+    def get_manga_chapters_stream(self, manga_id, on_batch, cancel_event=None):
+        """English chapters of a manga, calling on_batch with each batch"""
+        return self._stream(self.client.iter_manga_chapters(manga_id, ['en'], safety_limit=5000, skip_empty=True),
+                            on_batch, cancel_event)
+
+    def get_all_manga_chapters_stream(self, manga_id, on_batch, cancel_event=None,
+                                      languages=ALL_LANGUAGES):
+        """Chapters of a manga in multiple languages, calling on_batch with each batch"""
+        return self._stream(self.client.iter_manga_chapters(manga_id, languages, safety_limit=10000),
+                            on_batch, cancel_event)
+
+    def get_manga_updates(self, manga_ids, languages, updated_since, skip_empty=True):
+        """Chapters updated since a time for many manga at once, as manga id -> chapters"""
+        return self._run(self.client.get_manga_updates(manga_ids, languages, updated_since, skip_empty))
+
+    def resolve(self, kind, ids):
+        """Records for a list of ids of one entity kind, as a dict of id -> record"""
+        return self._run(self.client.resolve(kind, ids))
+
+    @property
+    def entities(self):
+        """The client's entity cache, shared by the GUI, queue and downloader"""
+        return self.client.entities
+
+    def get_chapter_server(self, chapter_id, use_cache=True):
+        """Ask /at-home/server for a node serving this chapter"""
+        return self._run(self.client.get_chapter_server(chapter_id, use_cache))
+
+    def cache_stats(self):
+        """Hit/miss counters of the response cache"""
+        return self.client.cache_stats()
+
+    def download_cover(self, manga_id, file_name, size=256, timeout=30, retries=2):
+        """Download a cover image (the small .256.jpg variant by default), None on failure"""
+        return self._run(self.client.download_cover(manga_id, file_name, size, timeout, retries))
+
     def get_manga_title(self, manga_data):
-        """Extract manga title from manga data"""
-        attributes = manga_data.get('attributes', {})
-        title = attributes.get('title', {})
-        
-        # Try to get English title first
-        if 'en' in title:
-            return title['en']
-        
-        # If no English title, get the first available title
-        if title:
-            return list(title.values())[0]
-        
-        return "Unknown Title"
\ No newline at end of file
+        """Extract manga title from manga data, parsed once per manga"""
+        return self.client.get_manga_title(manga_data)
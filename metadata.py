@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+# Compact records, only what the GUI, queue and downloader actually show
+MangaRecord = namedtuple('MangaRecord', [
+    'id', 'title', 'alt_titles', 'status', 'year', 'original_language', 'content_rating',
+    'cover_file', 'author_ids', 'artist_ids'
+])
+ChapterRecord = namedtuple('ChapterRecord', [
+    'id', 'manga_id', 'chapter', 'volume', 'title', 'language', 'pages', 'group_ids', 'readable_at'
+])
+GroupRecord = namedtuple('GroupRecord', ['id', 'name'])
+AuthorRecord = namedtuple('AuthorRecord', ['id', 'name'])
+
+def localized(values, default=None):
+    """Pick the English entry of a localized string map, else the first one"""
+    if not values:
+        return default
+    if 'en' in values:
+        return values['en']
+    return next(iter(values.values()))
+
+def _related_ids(entity, relationship_type):
+    return tuple(relationship['id'] for relationship in entity.get('relationships', [])
+                 if relationship.get('type') == relationship_type)
+
+def manga_record(manga):
+    attrs = manga.get('attributes', {})
+    cover_file = None
+    for relationship in manga.get('relationships', []):
+        if relationship.get('type') == 'cover_art':
+            cover_file = relationship.get('attributes', {}).get('fileName')
+
+    return MangaRecord(
+        id=manga['id'],
+        title=localized(attrs.get('title'), "Unknown Title"),
+        alt_titles=tuple(title for alt in attrs.get('altTitles', []) for title in alt.values()),
+        status=attrs.get('status'),
+        year=attrs.get('year'),
+        original_language=attrs.get('originalLanguage'),
+        content_rating=attrs.get('contentRating'),
+        cover_file=cover_file,
+        author_ids=_related_ids(manga, 'author'),
+        artist_ids=_related_ids(manga, 'artist')
+    )
+
+def chapter_record(chapter):
+    attrs = chapter.get('attributes', {})
+    manga_ids = _related_ids(chapter, 'manga')
+    return ChapterRecord(
+        id=chapter['id'],
+        manga_id=manga_ids[0] if manga_ids else None,
+        chapter=attrs.get('chapter'),
+        volume=attrs.get('volume'),
+        title=attrs.get('title'),
+        language=attrs.get('translatedLanguage'),
+        pages=attrs.get('pages'),
+        group_ids=_related_ids(chapter, 'scanlation_group'),
+        readable_at=attrs.get('readableAt')
+    )
+
+def group_record(group):
+    return GroupRecord(id=group['id'], name=group.get('attributes', {}).get('name'))
+
+def author_record(author):
+    return AuthorRecord(id=author['id'], name=author.get('attributes', {}).get('name'))
+
+# Entity type -> (cache kind, normalizer). Artists are author entities
+NORMALIZERS = {
+    'manga': ('manga', manga_record),
+    'chapter': ('chapter', chapter_record),
+    'scanlation_group': ('scanlation_group', group_record),
+    'author': ('author', author_record),
+    'artist': ('author', author_record),
+}
+
+class EntityCache:
+    """Bounded LRU of normalized entity records, shared by everything using one API client.
+
+    Full entities from any response are absorbed as they pass through, along
+    with related entities that came with attributes (includes[]), so most
+    lookups never need a request of their own.
+    """
+
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self.records = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, kind, entity_id):
+        key = (kind, entity_id)
+        with self.lock:
+            record = self.records.get(key)
+            if record is not None:
+                self.records.move_to_end(key)
+            return record
+
+    def put(self, kind, record):
+        key = (kind, record.id)
+        with self.lock:
+            self.records[key] = record
+            self.records.move_to_end(key)
+            while len(self.records) > self.max_entries:
+                self.records.popitem(last=False)
+
+    def missing(self, kind, ids):
+        """The ids with no cached record"""
+        with self.lock:
+            return [entity_id for entity_id in ids if (kind, entity_id) not in self.records]
+
+    def record_for(self, entity):
+        """Normalized record of a raw entity, parsed once and then served from the cache"""
+        kind, normalize = NORMALIZERS[entity['type']]
+        record = self.get(kind, entity['id'])
+        if record is None:
+            record = normalize(entity)
+            self.put(kind, record)
+        return record
+
+    def absorb(self, entities):
+        """Store every entity of a response, plus related entities that carry attributes"""
+        for entity in entities:
+            if entity.get('type') not in NORMALIZERS or 'attributes' not in entity:
+                continue
+            kind, normalize = NORMALIZERS[entity['type']]
+            self.put(kind, normalize(entity))
+
+            for relationship in entity.get('relationships', []):
+                if relationship.get('type') in NORMALIZERS and relationship.get('attributes'):
+                    kind, normalize = NORMALIZERS[relationship['type']]
+                    # Included entities have no relationships of their own, never
+                    # let one replace a complete record
+                    if self.get(kind, relationship['id']) is None:
+                        self.put(kind, normalize(relationship))
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
@@ -0,0 +1,281 @@
+import json
+import math
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from cache-speed lookups to stalled transfers
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for name, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def samples(self):
+        """(suffix, labels key, extra labels, value) tuples for export"""
+        with self.lock:
+            return [('', key, (), value) for key, value in self.values.items()]
+
+    def to_dict(self):
+        with self.lock:
+            return {'type': self.kind, 'help': self.help,
+                    'values': [{'labels': dict(key), 'value': value} for key, value in self.values.items()]}
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(_label_key(labels), 0)
+
+    def total(self, **labels):
+        """Sum over every label set that includes the given labels"""
+        wanted = set(_label_key(labels))
+        with self.lock:
+            return sum(value for key, value in self.values.items() if wanted.issubset(key))
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    """Bucketed observations (usually seconds) with count and sum per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * (len(self.buckets) + 1), 'count': 0, 'sum': 0.0}
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            state['counts'][index] += 1
+            state['count'] += 1
+            state['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q, **labels):
+        """Estimate a quantile from the buckets (upper bound of the bucket it falls in)"""
+        with self.lock:
+            state = self.values.get(_label_key(labels))
+            if not state or not state['count']:
+                return None
+            rank = q * state['count']
+            seen = 0
+            for bound, count in zip(self.buckets + (math.inf,), state['counts']):
+                seen += count
+                if seen >= rank:
+                    return bound
+        return math.inf
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, state in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), state['counts']):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else repr(float(bound))
+                    samples.append(('_bucket', key, (('le', le),), cumulative))
+                samples.append(('_count', key, (), state['count']))
+                samples.append(('_sum', key, (), state['sum']))
+        return samples
+
+    def to_dict(self):
+        with self.lock:
+            values = [{'labels': dict(key), 'count': state['count'], 'sum': state['sum'],
+                       'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], state['counts']))}
+                      for key, state in self.values.items()]
+        for entry in values:
+            for q in (0.5, 0.99):
+                entry[f'p{int(q * 100)}'] = self.quantile(q, **entry['labels'])
+        return {'type': self.kind, 'help': self.help, 'values': values}
+
+class MetricsRegistry:
+    """Named metrics plus collectors that report live numbers (cache, node health) on export"""
+
+    def __init__(self, prefix="mangadex_"):
+        self.prefix = prefix
+        self.metrics = {}
+        self.collectors = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(self.prefix + name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def register_collector(self, name, collector):
+        """collector() returns {name: value} or {name: [(labels, value), ...]}, exported as gauges.
+
+        Several collectors can share a name (one per cache, downloader, ...),
+        their gauges then get an instance label. Bound methods are held
+        weakly, a collector goes away with the object it belongs to.
+        """
+        if hasattr(collector, '__self__'):
+            reference = weakref.WeakMethod(collector)
+        else:
+            def reference():
+                return collector
+        with self.lock:
+            self.collectors.setdefault(name, []).append(reference)
+
+    def _collected(self):
+        gauges = {}
+        groups = []
+        with self.lock:
+            for name, references in list(self.collectors.items()):
+                # Drop collectors whose owner was garbage collected
+                live = [(reference, reference()) for reference in references]
+                live = [(reference, collector) for reference, collector in live if collector is not None]
+                if live:
+                    self.collectors[name] = [reference for reference, _ in live]
+                    groups.append([collector for _, collector in live])
+                else:
+                    del self.collectors[name]
+
+        for collectors in groups:
+            for instance, collector in enumerate(collectors):
+                extra = {'instance': instance} if len(collectors) > 1 else {}
+                try:
+                    for name, value in collector().items():
+                        entries = value if isinstance(value, list) else [({}, value)]
+                        gauges.setdefault(self.prefix + name, []).extend(
+                            (_label_key(dict(labels, **extra)), value) for labels, value in entries)
+                except Exception as e:
+                    print(f"Error collecting metrics: {e}")
+        return list(gauges.items())
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, key, extra, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(key, extra)} {value}")
+        for name, entries in self._collected():
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in entries:
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        result = {'uptime_seconds': round(time.time() - self.started, 3)}
+        for metric in metrics:
+            result[metric.name] = metric.to_dict()
+        for name, entries in self._collected():
+            result[name] = {'type': 'gauge', 'values': [{'labels': dict(key), 'value': value}
+                                                        for key, value in entries]}
+        return result
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def dump(self, path):
+        """Write the metrics to a file, .json gets JSON and anything else Prometheus text"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_json() if path.endswith('.json') else self.to_prometheus())
+
+# Process-wide registry and the metrics of the download hot paths
+REGISTRY = MetricsRegistry()
+
+API_LATENCY = REGISTRY.histogram('api_request_seconds', "Time to response headers by endpoint and status")
+API_RETRIES = REGISTRY.counter('api_retries_total', "API requests retried, by endpoint and reason")
+RATE_LIMIT_WAIT = REGISTRY.histogram('rate_limit_wait_seconds', "Time spent waiting for a rate limit token")
+NODE_LATENCY = REGISTRY.histogram('node_page_seconds', "Page fetch latency per at-home node")
+PAGE_BYTES = REGISTRY.counter('page_bytes_total', "Page bytes downloaded")
+PAGES = REGISTRY.counter('pages_total', "Pages handled by result (downloaded, staged, failed)")
+IMAGE_CONVERT = REGISTRY.histogram('image_convert_seconds', "Page decode/encode time, including pool wait")
+OUTPUT_WRITE = REGISTRY.histogram('output_write_seconds', "Time spent writing the output file per chapter")
+CHAPTER_TIME = REGISTRY.histogram('chapter_seconds', "Whole chapter download time by format and result",
+                                  buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600))
+
+def endpoint_label(path):
+    """Collapse ids out of an API path so latency groups by endpoint, not by manga"""
+    parts = [part for part in path.split('/') if part]
+    return '/' + '/'.join('{id}' if len(part) == 36 and part.count('-') == 4 else part for part in parts)
+
+class Throughput:
+    """Pages and bytes per second for one running job, for status lines"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.pages = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def add(self, page_bytes):
+        with self.lock:
+            self.pages += 1
+            self.bytes += page_bytes
+
+    def rates(self):
+        """(pages/s, bytes/s) since the job started"""
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        with self.lock:
+            return self.pages / elapsed, self.bytes / elapsed
+
+    def describe(self):
+        pages_per_second, bytes_per_second = self.rates()
+        return f"{pages_per_second:.1f} pages/s, {bytes_per_second / 1024:.0f} KB/s"
@@ -0,0 +1,47 @@
+import threading
+
+class NodeHealth:
+    """Tracks latency and error rate of MangaDex@Home nodes.
+
+    Latency and error rate are exponentially weighted moving averages per
+    node, so a node that recovers (or starts failing) after a long run shows
+    it within a few dozen requests. A node is unhealthy once it has enough
+    samples and is either too slow or fails too often.
+    """
+
+    def __init__(self, slow_seconds=8.0, max_error_rate=0.25, min_samples=3, alpha=0.3, error_alpha=0.1):
+        self.slow_seconds = slow_seconds
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.alpha = alpha
+        self.error_alpha = error_alpha
+        self.nodes = {}
+        self.lock = threading.Lock()
+
+    def record(self, base_url, latency, ok):
+        with self.lock:
+            node = self.nodes.setdefault(base_url, {'latency': latency, 'requests': 0, 'error_rate': 0.0})
+            node['requests'] += 1
+            node['error_rate'] = self.error_alpha * (not ok) + (1 - self.error_alpha) * node['error_rate']
+            if ok:
+                node['latency'] = self.alpha * latency + (1 - self.alpha) * node['latency']
+
+    def is_unhealthy(self, base_url):
+        with self.lock:
+            node = self.nodes.get(base_url)
+            if not node or node['requests'] < self.min_samples:
+                return False
+
+            return node['error_rate'] > self.max_error_rate or node['latency'] > self.slow_seconds
+
+    def stats(self):
+        """Snapshot of every node seen so far"""
+        with self.lock:
+            return {
+                base_url: {
+                    'latency': round(node['latency'], 3),
+                    'requests': node['requests'],
+                    'error_rate': round(node['error_rate'], 3)
+                }
+                for base_url, node in self.nodes.items()
+            }
@@ -0,0 +1,210 @@
+import mmap
+import os
+import re
+import struct
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+from pdf_writer import StreamingPDFWriter, JPEG_MAGIC, PNG_MAGIC
+from image_pipeline import prepare_page
+
+OUTPUT_FORMATS = ('pdf', 'cbz')
+DEFAULT_FORMAT = 'pdf'
+
+COMIC_INFO = "ComicInfo.xml"
+
+IMAGE_EXTENSIONS = (
+    (JPEG_MAGIC, 'jpg'),
+    (PNG_MAGIC, 'png'),
+    (b'GIF8', 'gif'),
+)
+
+def image_extension(image_data):
+    """File extension for page bytes, guessed from their magic number"""
+    for magic, extension in IMAGE_EXTENSIONS:
+        if image_data.startswith(magic):
+            return extension
+    if image_data[:4] == b'RIFF' and image_data[8:12] == b'WEBP':
+        return 'webp'
+    return 'bin'
+
+def comic_info_xml(series=None, number=None, volume=None, title=None, language=None, page_count=None):
+    """Build a minimal ComicInfo.xml (the ComicRack schema most readers understand)"""
+    fields = (
+        ('Title', title),
+        ('Series', series),
+        ('Number', number),
+        ('Volume', volume),
+        ('PageCount', page_count),
+        ('LanguageISO', language),
+        ('Manga', 'Yes'),
+    )
+    lines = ['<?xml version="1.0" encoding="utf-8"?>',
+             '<ComicInfo xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+             'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">']
+    for name, value in fields:
+        if value not in (None, ''):
+            lines.append(f"  <{name}>{escape(str(value))}</{name}>")
+    lines.append('</ComicInfo>')
+    return '\n'.join(lines) + '\n'
+
+class CBZWriter:
+    """Write a CBZ one page at a time, the original page bytes are stored as-is.
+
+    Pages are already compressed images so the archive uses ZIP_STORED, adding
+    a page is a plain copy to disk. ComicInfo.xml is written on close.
+    """
+
+    def __init__(self, path, metadata=None):
+        self.zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+        self.metadata = dict(metadata or {})
+        self.pages = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.zip.close()
+
+    @property
+    def page_count(self):
+        return self.pages
+
+    def add_page(self, image_data):
+        self.pages += 1
+        self.zip.writestr(f"{self.pages:04d}.{image_extension(image_data)}", image_data)
+
+    def close(self):
+        if self.zip.fp is None:
+            return
+        self.zip.writestr(COMIC_INFO, comic_info_xml(page_count=self.pages, **self.metadata))
+        self.zip.close()
+
+class PDFOutput(StreamingPDFWriter):
+    """StreamingPDFWriter with the output-format constructor, PDFs carry no metadata.
+
+    Pages must already be PDF-ready (see needs_conversion), the downloader's
+    image pipeline takes care of that.
+    """
+
+    def __init__(self, path, metadata=None):
+        super().__init__(path)
+
+WRITERS = {'pdf': PDFOutput, 'cbz': CBZWriter}
+
+def open_writer(output_format, path, metadata=None):
+    """Open a page writer for one of OUTPUT_FORMATS"""
+    if output_format not in WRITERS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    return WRITERS[output_format](path, metadata)
+
+def needs_conversion(output_format):
+    """Whether pages have to go through the image pipeline before this writer sees them"""
+    return output_format == 'pdf'
+
+# Reading pages back out of finished chapters
+
+# An image XObject dictionary (one level of nested << >> for DecodeParms) and its stream
+PDF_IMAGE_RE = re.compile(rb'<<((?:[^<>]|<<[^<>]*>>)*?/Subtype\s*/Image(?:[^<>]|<<[^<>]*>>)*)>>\s*stream\r?\n')
+# A page object, /Type /Pages (the page tree) doesn't count
+PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+
+def _pdf_number(dictionary, key, default=None):
+    match = re.search(rb'/' + key + rb'\s+(\d+)\b(?!\s+\d+\s+R)', dictionary)
+    return int(match.group(1)) if match else default
+
+def _png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+def _pdf_image_to_page(dictionary, stream):
+    """Turn an embedded image back into the page file it was made from"""
+    if b'/DCTDecode' in dictionary:
+        return bytes(stream)
+
+    if b'/FlateDecode' in dictionary and _pdf_number(dictionary, b'Predictor') == 15:
+        # PNG scanlines stored with their filters, the IDAT data only needs a PNG header again
+        width = _pdf_number(dictionary, b'Width')
+        height = _pdf_number(dictionary, b'Height')
+        bit_depth = _pdf_number(dictionary, b'BitsPerComponent', 8)
+        color_type = 0 if _pdf_number(dictionary, b'Colors', 1) == 1 else 2
+        header = struct.pack('>IIBBBBB', width, height, bit_depth, color_type, 0, 0, 0)
+        return (PNG_MAGIC + _png_chunk(b'IHDR', header) + _png_chunk(b'IDAT', bytes(stream)) +
+                _png_chunk(b'IEND', b''))
+
+    raise ValueError("PDF page image can't be extracted without decoding it")
+
+def iter_pdf_pages(path):
+    """Yield the page images of a PDF made of one full-page image per page.
+
+    Works on the PDFs StreamingPDFWriter (and img2pdf) produce: JPEG pages
+    come back byte for byte, PNG pages as a PNG around the original IDAT data.
+    This is a scan, not a PDF parser: anything else (encrypted files, object
+    streams, masks, pages without exactly one image) raises ValueError
+    rather than yielding the wrong pages.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:5] != b'%PDF-':
+            raise ValueError(f"{path}: not a PDF file")
+        if data.find(b'/Encrypt') != -1 or data.find(b'/ObjStm') != -1:
+            raise ValueError(f"{path}: encrypted or compressed PDF structure, can't read its pages")
+
+        pos = 0
+        images = pages = 0
+        while True:
+            match = PDF_IMAGE_RE.search(data, pos)
+            # Page objects are counted outside image data only
+            pages += len(PDF_PAGE_RE.findall(data, pos, match.start() if match else len(data)))
+            if not match:
+                break
+            dictionary = match.group(1)
+            if b'/SMask' in dictionary or b'/ImageMask' in dictionary:
+                raise ValueError(f"{path}: masked images, not a one-image-per-page PDF")
+            length = _pdf_number(dictionary, b'Length')
+            if length is None:
+                raise ValueError(f"{path}: image stream without a direct /Length")
+            start = match.end()
+            # Skip over the image data, it is never searched
+            pos = start + length
+            images += 1
+            yield _pdf_image_to_page(dictionary, data[start:pos])
+
+        if images != pages:
+            raise ValueError(f"{path}: {pages} pages but {images} images, not a one-image-per-page PDF")
+
+def iter_cbz_pages(path):
+    """Yield the page images of a CBZ in reading order"""
+    with zipfile.ZipFile(path) as archive:
+        names = sorted(name for name in archive.namelist()
+                       if not name.endswith('/') and name != COMIC_INFO)
+        for name in names:
+            yield archive.read(name)
+
+def iter_pages(path):
+    """Yield the raw page images of a finished chapter file"""
+    if path.lower().endswith('.cbz'):
+        return iter_cbz_pages(path)
+    return iter_pdf_pages(path)
+
+def merge_files(paths, output_path, output_format=DEFAULT_FORMAT, metadata=None):
+    """Copy the pages of several chapter files into one file, returns the page count"""
+    part_path = output_path + ".part"
+    convert = needs_conversion(output_format)
+    try:
+        with open_writer(output_format, part_path, metadata) as writer:
+            for path in paths:
+                # Pages read back from a PDF are embeddable already, CBZ pages may not be
+                from_pdf = not path.lower().endswith('.cbz')
+                for page in iter_pages(path):
+                    writer.add_page(prepare_page(page) if convert and not from_pdf else page)
+            page_count = writer.page_count
+
+        if not page_count:
+            raise Exception("No pages found in the chapters to merge")
+        os.replace(part_path, output_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return page_count
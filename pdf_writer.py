@@ -0,0 +1,176 @@
+import struct
+
+JPEG_MAGIC = b'\xff\xd8\xff'
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+
+# Page size assumed for images without usable DPI info (same as img2pdf)
+DEFAULT_DPI = 96
+
+# SOF markers carrying the frame size (DHT, JPG and DAC share the range)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+COLOR_SPACES = {1: '/DeviceGray', 3: '/DeviceRGB', 4: '/DeviceCMYK'}
+
+def read_jpeg_info(data):
+    """Return (width, height, components, adobe) from a JPEG header"""
+    adobe = False
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            pos += 1
+            continue
+
+        marker = data[pos + 1]
+        # Standalone markers have no length field
+        if marker == 0xFF or marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            pos += 2 if marker != 0xFF else 1
+            continue
+
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker == 0xEE and data[pos + 4:pos + 9] == b'Adobe':
+            adobe = True
+        if marker in SOF_MARKERS:
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            components = data[pos + 9]
+            return width, height, components, adobe
+
+        pos += 2 + length
+
+    raise ValueError("JPEG has no frame header")
+
+def read_png_info(data):
+    """Return (width, height, bit_depth, color_type, interlace, idat) from a PNG"""
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', data[16:29])
+
+    idat = []
+    pos = 8
+    while pos + 8 <= len(data):
+        length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+        if chunk_type == b'IDAT':
+            idat.append(data[pos + 8:pos + 8 + length])
+        elif chunk_type == b'IEND':
+            break
+        pos += 12 + length
+
+    return width, height, bit_depth, color_type, interlace, b''.join(idat)
+
+class StreamingPDFWriter:
+    """Write a PDF one page at a time - each page is flushed to disk as soon as it is added.
+
+    Only JPEG and non-interlaced grayscale/RGB PNG data is accepted, anything
+    else has to be converted first (see image_pipeline.prepare_page).
+    """
+
+    def __init__(self, path, dpi=DEFAULT_DPI):
+        self.file = open(path, 'wb')
+        self.dpi = dpi
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+
+        # Object 1 is the catalog and 2 the page tree, both written on close
+        self.next_id = 3
+
+        self._write(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    @property
+    def page_count(self):
+        return len(self.page_ids)
+
+    def _write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+
+    def _reserve_id(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, body):
+        self.offsets[obj_id] = self.position
+        self._write(f"{obj_id} 0 obj\n{body}\nendobj\n".encode('latin-1'))
+
+    def _write_stream(self, obj_id, dictionary, data):
+        self.offsets[obj_id] = self.position
+        self._write(f"{obj_id} 0 obj\n<< {dictionary} /Length {len(data)} >>\nstream\n".encode('latin-1'))
+        self._write(data)
+        self._write(b"\nendstream\nendobj\n")
+
+    def _image_stream(self, image_data):
+        """Build the XObject dictionary and stream for raw page bytes"""
+        if image_data.startswith(JPEG_MAGIC):
+            width, height, components, adobe = read_jpeg_info(image_data)
+            if components not in COLOR_SPACES:
+                raise ValueError(f"Unsupported JPEG with {components} components")
+
+            dictionary = (f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                          f"/ColorSpace {COLOR_SPACES[components]} /BitsPerComponent 8 /Filter /DCTDecode")
+            # Adobe CMYK JPEGs are stored inverted
+            if components == 4 and adobe:
+                dictionary += " /Decode [1 0 1 0 1 0 1 0]"
+            return width, height, dictionary, image_data
+
+        if image_data.startswith(PNG_MAGIC):
+            width, height, bit_depth, color_type, interlace, idat = read_png_info(image_data)
+            if color_type not in (0, 2) or interlace:
+                raise ValueError("Only non-interlaced grayscale/RGB PNG pages can be embedded directly")
+
+            colors = 1 if color_type == 0 else 3
+            # PNG scanlines are embedded as-is, the predictor undoes the PNG filters
+            dictionary = (f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                          f"/ColorSpace {COLOR_SPACES[colors]} /BitsPerComponent {bit_depth} /Filter /FlateDecode "
+                          f"/DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent {bit_depth} "
+                          f"/Columns {width} >>")
+            return width, height, dictionary, idat
+
+        raise ValueError("Unsupported image format for PDF page")
+
+    def add_page(self, image_data):
+        """Append one page holding a single full-page image"""
+        width, height, dictionary, stream = self._image_stream(image_data)
+
+        page_width = width * 72 / self.dpi
+        page_height = height * 72 / self.dpi
+
+        image_id = self._reserve_id()
+        content_id = self._reserve_id()
+        page_id = self._reserve_id()
+
+        self._write_stream(image_id, dictionary, stream)
+
+        content = f"q {page_width:.4f} 0 0 {page_height:.4f} 0 0 cm /Im0 Do Q".encode('latin-1')
+        self._write_stream(content_id, "", content)
+
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.4f} {page_height:.4f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        """Write the page tree, catalog, xref table and trailer"""
+        if self.file.closed:
+            return
+
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>")
+        self._write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_offset = self.position
+        size = self.next_id
+        xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, size):
+            xref.append(f"{self.offsets[obj_id]:010d} 00000 n \n")
+        xref.append(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self._write(''.join(xref).encode('latin-1'))
+
+        self.file.close()
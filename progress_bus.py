@@ -0,0 +1,109 @@
+import copy
+import threading
+import time
+
+# Stages a job moves through, the last three are terminal
+STARTING = 'starting'
+DOWNLOADING = 'downloading'
+WRITING = 'writing'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+TERMINAL_STAGES = (DONE, FAILED, CANCELLED)
+
+class JobProgress:
+    """Latest known state of one job, as the UI sees it after a drain"""
+
+    def __init__(self, job):
+        self.job = job
+        self.stage = STARTING
+        self.message = ""
+        self.progress = 0
+        self.pages = 0
+        self.total = 0
+        # Pages and bytes actually fetched, staged pages from an earlier run count in pages only
+        self.downloaded = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.updated = self.started
+
+    @property
+    def finished(self):
+        return self.stage in TERMINAL_STAGES
+
+    def rates(self):
+        """(pages/s, bytes/s) downloaded since the job started"""
+        elapsed = max(self.updated - self.started, 1e-6)
+        return self.downloaded / elapsed, self.bytes / elapsed
+
+    def describe(self):
+        """One status line, page counts and speed while downloading, else the stage message"""
+        if self.stage == DOWNLOADING and self.pages:
+            pages_per_second, bytes_per_second = self.rates()
+            return (f"Downloaded page {self.pages}/{self.total} "
+                    f"({pages_per_second:.1f} pages/s, {bytes_per_second / 1024:.0f} KB/s)")
+        return self.message
+
+class ProgressBus:
+    """Thread-safe progress mailbox between download workers and the Tk thread.
+
+    Workers publish structured updates (stage changes, pages done, bytes)
+    for a job key as often as they like; each update only overwrites that
+    job's state and marks it dirty. The UI calls drain() on a fixed timer and
+    gets one snapshot per job that changed since the last drain, so the cost
+    on the Tk side depends on the frame rate and the number of jobs, not on
+    how many pages or workers report.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.dirty = set()
+
+    def _job(self, job):
+        state = self.jobs.get(job)
+        if state is None:
+            state = self.jobs[job] = JobProgress(job)
+        return state
+
+    def stage(self, job, stage, message=None, progress=None):
+        """The job moved to another stage, optionally with a status message and progress"""
+        with self.lock:
+            state = self._job(job)
+            state.stage = stage
+            if message is not None:
+                state.message = message
+            if progress is not None:
+                state.progress = progress
+            state.updated = time.monotonic()
+            self.dirty.add(job)
+
+    def pages(self, job, done, total, downloaded, bytes_done, progress):
+        """Page counters of a downloading job, cumulative so repeated updates coalesce.
+
+        done counts every finished page, downloaded and bytes_done only the
+        ones fetched from the network.
+        """
+        with self.lock:
+            state = self._job(job)
+            state.stage = DOWNLOADING
+            state.pages = done
+            state.total = total
+            state.downloaded = downloaded
+            state.bytes = bytes_done
+            state.progress = progress
+            state.updated = time.monotonic()
+            self.dirty.add(job)
+
+    def drain(self):
+        """Snapshots of every job updated since the last drain.
+
+        Finished jobs are forgotten once they have been handed out.
+        """
+        with self.lock:
+            updates = [copy.copy(self.jobs[job]) for job in self.dirty]
+            self.dirty.clear()
+            for update in updates:
+                if update.finished:
+                    del self.jobs[update.job]
+        return updates
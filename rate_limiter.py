@@ -0,0 +1,133 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# Requests per second and burst size for each bucket. MangaDex allows about
+# 5 req/s per IP on the API and 40 req/min on /at-home/server, the at-home
+# image nodes are far more permissive. Cover images come from their own host
+# and get their own bucket, so browsing never eats into page downloads.
+DEFAULT_LIMITS = {
+    'api': (5.0, 5),
+    'at-home-server': (40 / 60, 40),
+    'at-home': (20.0, 20),
+    'covers': (10.0, 10)
+}
+
+class TokenBucket:
+    """Async token bucket that can also be blocked until a point in time"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+
+                await asyncio.sleep(wait)
+
+    def block_for(self, seconds):
+        """Hold every request on this bucket for the given number of seconds"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def limit_remaining(self, remaining):
+        """Never send more than the server says we have left"""
+        self.tokens = min(self.tokens, float(remaining))
+
+def parse_retry_after(value):
+    """Retry-After holds either seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """Rate limiter shared by every request of a MangaDex client.
+
+    Keeps separate buckets for the API, the at-home server lookup and the
+    at-home image nodes, and adapts them to the rate limit headers returned
+    by the server.
+    """
+
+    def __init__(self, api_url="https://api.mangadex.org", limits=None,
+                 covers_url="https://uploads.mangadex.org/covers"):
+        self.api_host = urlparse(api_url).netloc
+        self.covers_prefix = covers_url.rstrip('/') + '/'
+        self.buckets = {
+            name: TokenBucket(rate, capacity)
+            for name, (rate, capacity) in (limits or DEFAULT_LIMITS).items()
+        }
+
+    def bucket_for(self, url):
+        if url.startswith(self.covers_prefix):
+            return 'covers'
+        parsed = urlparse(url)
+        if parsed.netloc != self.api_host:
+            return 'at-home'
+        if parsed.path.startswith('/at-home/server/'):
+            return 'at-home-server'
+        return 'api'
+
+    async def acquire(self, bucket):
+        await self.buckets[bucket].acquire()
+
+    def update(self, bucket, status, headers):
+        """Adjust a bucket from a response, returns the server's retry delay if any"""
+        token_bucket = self.buckets[bucket]
+        retry_after = None
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is not None:
+            try:
+                token_bucket.limit_remaining(int(remaining))
+            except ValueError:
+                pass
+
+        # MangaDex sends the unix time at which the limit resets
+        reset_at = headers.get('X-RateLimit-Retry-After')
+        if reset_at and (remaining == '0' or status == 429):
+            try:
+                retry_after = max(0.0, float(reset_at) - time.time())
+            except ValueError:
+                pass
+
+        if status in (429, 503):
+            header_delay = parse_retry_after(headers.get('Retry-After'))
+            if header_delay is not None:
+                retry_after = max(retry_after or 0.0, header_delay)
+
+        if retry_after:
+            token_bucket.block_for(retry_after)
+
+        return retry_after
+
+    @staticmethod
+    def backoff_delay(attempt, base=0.5, cap=30.0):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,179 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+# Seconds a response stays fresh, by API path. Paths not listed are never cached.
+DEFAULT_TTLS = [
+    (re.compile(r'^/manga/[^/]+/feed$'), 10 * 60),
+    (re.compile(r'^/manga$'), 30 * 60),
+    # at-home assignments carry a short-lived token, keep them well under its lifetime
+    (re.compile(r'^/at-home/server/[^/]+$'), 5 * 60)
+]
+
+class ResponseCache:
+    """Persistent SQLite cache for MangaDex API JSON responses.
+
+    Entries are keyed on the URL plus its sorted query params. Each endpoint
+    has its own TTL, stale entries are revalidated with ETag/Last-Modified
+    when the server sent them, and the least recently used entries are
+    evicted once the cache grows past max_bytes, down to EVICT_TO of it so
+    eviction doesn't run on every insert. The total size is kept as a
+    running count. Hits only note their access time in memory; those are
+    written out with the next put, revalidation or flush(), so a cache hit
+    never costs a database write.
+
+    Every call does blocking SQLite I/O, async callers should run them in
+    an executor.
+    """
+
+    # Share of max_bytes left after an eviction
+    EVICT_TO = 0.9
+
+    # Pending access times written out even without a put
+    MAX_PENDING_ACCESSES = 256
+
+    def __init__(self, path=os.path.join("cache", "responses.db"), max_bytes=64 * 1024 * 1024, ttls=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.ttls = ttls or DEFAULT_TTLS
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stored': 0, 'evicted': 0}
+        # key -> last access time not yet in the database
+        self.accessed = {}
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                ttl REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(url, params=None):
+        """URL plus normalized params, so param order never causes a miss"""
+        pairs = sorted(params or [])
+        return f"{url}?{urlencode(pairs)}" if pairs else url
+
+    def ttl_for(self, url):
+        path = urlparse(url).path
+        for pattern, ttl in self.ttls:
+            if pattern.match(path):
+                return ttl
+        return None
+
+    def get(self, key):
+        """Return the cached entry (fresh or stale) or None"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT body, etag, last_modified, stored_at, ttl FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.counters['misses'] += 1
+                return None
+
+            now = time.time()
+            self.accessed[key] = now
+            if len(self.accessed) >= self.MAX_PENDING_ACCESSES:
+                self._write_accessed()
+                self.db.commit()
+
+            body, etag, last_modified, stored_at, ttl = row
+            fresh = now - stored_at < ttl
+            self.counters['hits' if fresh else 'misses'] += 1
+            return {'body': body, 'etag': etag, 'last_modified': last_modified, 'fresh': fresh}
+
+    def put(self, key, body, ttl, etag=None, last_modified=None):
+        now = time.time()
+        with self.lock:
+            replaced = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, body, etag, last_modified, now, now, ttl, len(body))
+            )
+            self.total_bytes += len(body) - (replaced[0] if replaced else 0)
+            self.accessed.pop(key, None)
+            self.counters['stored'] += 1
+            # Eviction goes by access time, so it has to see the recent hits
+            self._write_accessed()
+            self._evict()
+            self.db.commit()
+
+    def revalidated(self, key):
+        """The server answered 304, the stored body is fresh again"""
+        now = time.time()
+        with self.lock:
+            self.db.execute("UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            self.accessed.pop(key, None)
+            self._write_accessed()
+            self.db.commit()
+            self.counters['revalidated'] += 1
+
+    def _write_accessed(self):
+        """Write the pending access times, caller holds the lock and commits"""
+        if self.accessed:
+            self.db.executemany("UPDATE responses SET accessed_at = ? WHERE key = ?",
+                                [(accessed_at, key) for key, accessed_at in self.accessed.items()])
+            self.accessed.clear()
+
+    def flush(self):
+        """Write access times still held in memory"""
+        with self.lock:
+            self._write_accessed()
+            self.db.commit()
+
+    def _evict(self):
+        """Drop least recently used entries once over max_bytes, caller holds the lock"""
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        target = self.max_bytes * self.EVICT_TO
+        while self.total_bytes > target:
+            oldest = self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at LIMIT 64").fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if self.total_bytes <= target:
+                    break
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.counters['evicted'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.accessed.clear()
+            self.total_bytes = 0
+            self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            size = self.total_bytes
+            stats = dict(self.counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['entries'] = entries
+        stats['bytes'] = size
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self.lock:
+            self._write_accessed()
+            self.db.commit()
+            self.db.close()
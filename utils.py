@@ -1,7 +1,10 @@
-import json
 import os
 import re
-from datetime import datetime
+import threading
+from history_store import HistoryStore
+
+_history_store = None
+_history_lock = threading.Lock()
 
 def sanitize_filename(filename):
     """Sanitize filename to be safe for filesystem"""
@@ -14,33 +17,20 @@ def sanitize_filename(filename):
         filename = filename[:200]
     return filename
 
-def save_to_history(manga_title, chapter_number, file_path):
-    """Save download history to JSON file"""
-    history_file = "history.json"
-    
-    # Load existing history
-    history = []
-    if os.path.exists(history_file):
-        try:
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        except:
-            history = []
-    
-    # Add new entry
-    entry = {
-        "manga_title": manga_title,
-        "chapter_number": chapter_number,
-        "file_path": file_path,
-        "download_date": datetime.now().isoformat()
-    }
-    
-    history.append(entry)
-    
-    # Save updated history
+def get_history_store():
+    """Shared download history, history.json is migrated on first use"""
+    global _history_store
+    with _history_lock:
+        if _history_store is None:
+            _history_store = HistoryStore()
+        return _history_store
+
+def save_to_history(manga_title, chapter_number, file_path, manga_id=None, chapter_id=None,
+                    volume=None, language=None):
+    """Append a download to the history database"""
     try:
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
+        get_history_store().add(manga_title, chapter_number, file_path, manga_id=manga_id,
+                                chapter_id=chapter_id, volume=volume, language=language)
     except Exception as e:
         print(f"Error saving history: {e}")
 
@@ -49,6 +39,13 @@ def create_directory_if_not_exists(path):
     if not os.path.exists(path):
         os.makedirs(path)
 
+def parse_chapter_number(value):
+    """Convert a chapter string like "10.5" to a float, None if it isn't numeric"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
 def format_chapter_display(chapter):
     """Format chapter for display in listbox with enhanced info"""
     chapter_num = chapter.get('chapter', 'N/A')
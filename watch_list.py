@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from chapter_store import ChapterStore
+from mangadx_api import MangaDexAPI
+from utils import get_history_store
+
+def released_at(chapter):
+    """When a chapter became readable (readableAt, else publishAt) as a UTC datetime, None if unknown"""
+    attrs = chapter.get('attributes', {})
+    value = attrs.get('readableAt') or attrs.get('publishAt')
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+def released_since(chapter, moment):
+    """Whether a chapter became readable after moment, undated chapters never count as new"""
+    released = released_at(chapter)
+    return released is not None and released > moment
+
+class WatchList:
+    """Followed manga, checked for new chapters in a few batched requests.
+
+    Every followed manga remembers when it was last checked and which
+    chapters were already reported. A check asks /chapter for everything
+    updated since the oldest checkpoint, for up to 100 manga per query, and
+    reports chapters released since their manga's checkpoint that are
+    neither seen nor downloaded yet; an old chapter that was merely edited
+    comes back from the query but isn't new. Follows with
+    auto_download set are handed straight to the download queue. Titles are
+    refreshed from the shared entity cache, with one bulk lookup for the
+    manga it doesn't know yet.
+    """
+
+    def __init__(self, api=None, watch_file="watchlist.json", download_queue=None, overlap_minutes=5):
+        self.api = api or MangaDexAPI()
+        self.watch_file = watch_file
+        self.download_queue = download_queue
+        # Re-check a little before the last checkpoint so chapters indexed late aren't missed
+        self.overlap = timedelta(minutes=overlap_minutes)
+
+        self.lock = threading.Lock()
+        self.follows = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.watch_file):
+            return
+
+        try:
+            with open(self.watch_file, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except Exception as e:
+            print(f"Error loading watch list: {e}")
+            return
+
+        for follow in saved:
+            follow['seen'] = set(follow.get('seen', []))
+            self.follows[follow['manga_id']] = follow
+
+    def _save(self):
+        """Write the watch list atomically, caller must hold the lock"""
+        temp_file = self.watch_file + ".tmp"
+        saved = [dict(follow, seen=sorted(follow['seen'])) for follow in self.follows.values()]
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(saved, f, ensure_ascii=False)
+            os.replace(temp_file, self.watch_file)
+        except Exception as e:
+            print(f"Error saving watch list: {e}")
+
+    def follow(self, manga_id, title, languages=('en',), save_path=None, auto_download=False, output_format=None):
+        """Start watching a manga, only chapters updated from now on count as new"""
+        with self.lock:
+            follow = self.follows.get(manga_id) or {
+                'manga_id': manga_id,
+                'last_check': ChapterStore.timestamp(),
+                'seen': set()
+            }
+            follow.update({
+                'title': title,
+                'languages': sorted(languages),
+                'save_path': save_path,
+                'auto_download': bool(auto_download and save_path),
+                'output_format': output_format
+            })
+            self.follows[manga_id] = follow
+            self._save()
+
+    def unfollow(self, manga_id):
+        with self.lock:
+            if self.follows.pop(manga_id, None):
+                self._save()
+
+    def is_followed(self, manga_id):
+        with self.lock:
+            return manga_id in self.follows
+
+    def get_follows(self):
+        with self.lock:
+            return sorted((dict(follow) for follow in self.follows.values()), key=lambda follow: follow['title'])
+
+    def check(self, enqueue=True):
+        """Look for new chapters of every followed manga.
+
+        Returns a dict of manga id -> new chapters. With enqueue set, follows
+        marked auto_download are queued for download.
+        """
+        with self.lock:
+            follows = [dict(follow) for follow in self.follows.values()]
+        if not follows:
+            return {}
+
+        check_started = ChapterStore.timestamp()
+        history = get_history_store()
+
+        # Follows with the same languages share queries
+        groups = {}
+        for follow in follows:
+            groups.setdefault(tuple(follow['languages']), []).append(follow)
+
+        # Renamed manga show (and download) under their current title
+        try:
+            records = self.api.resolve('manga', [follow['manga_id'] for follow in follows])
+        except Exception as e:
+            print(f"Error refreshing followed titles: {e}")
+            records = {}
+        for follow in follows:
+            record = records.get(follow['manga_id'])
+            if record:
+                follow['title'] = record.title
+
+        new_chapters = {}
+        for languages, group in groups.items():
+            oldest = min(ChapterStore.parse(follow['last_check']) for follow in group)
+            updates = self.api.get_manga_updates(
+                [follow['manga_id'] for follow in group], list(languages),
+                ChapterStore.timestamp(oldest - self.overlap)
+            )
+
+            for follow in group:
+                manga_id = follow['manga_id']
+                downloaded = history.downloaded_chapter_ids(manga_id)
+                checkpoint = ChapterStore.parse(follow['last_check']) - self.overlap
+                fresh = [chapter for chapter in updates.get(manga_id, [])
+                         if chapter['id'] not in follow['seen'] and chapter['id'] not in downloaded
+                         and released_since(chapter, checkpoint)]
+                if fresh:
+                    new_chapters[manga_id] = fresh
+
+        with self.lock:
+            for follow in follows:
+                current = self.follows.get(follow['manga_id'])
+                if current is None:
+                    continue  # Unfollowed while we were checking
+                current['seen'].update(chapter['id'] for chapter in new_chapters.get(follow['manga_id'], []))
+                current['last_check'] = check_started
+                current['title'] = follow['title']
+            self._save()
+
+        total = sum(len(chapters) for chapters in new_chapters.values())
+        print(f"Checked {len(follows)} followed manga, {total} new chapters")
+
+        if enqueue and self.download_queue:
+            for manga_id, chapters in new_chapters.items():
+                follow = next(follow for follow in follows if follow['manga_id'] == manga_id)
+                if follow['auto_download']:
+                    self.download_queue.enqueue_chapters(chapters, follow['title'], follow['save_path'],
+                                                         manga_id=manga_id, output_format=follow['output_format'])
+
+        return new_chapters
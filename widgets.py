@@ -0,0 +1,281 @@
+import tkinter as tk
+from tkinter import ttk
+import tkinter.font as tkfont
+
+class VirtualListbox(ttk.Frame):
+    """Listbox look-alike that only draws the rows currently in view.
+
+    Rows are plain strings prepared by the caller (ideally off the UI
+    thread). Adding rows just extends a list, drawing reuses a small pool of
+    canvas items sized to the visible area, so tens of thousands of rows cost
+    no more to show than a screenful. Supports the Listbox calls the GUI
+    uses: curselection(), yview(), yscrollcommand, <<ListboxSelect>> and
+    single/extended selection.
+
+    With image_size set, rows get an image column filled by set_image().
+    Only images of rows near the view are kept; on_view(first, last) is
+    called whenever the visible rows change so the caller can load the
+    images for them.
+    """
+
+    BACKGROUND = 'white'
+    FOREGROUND = 'black'
+    SELECT_BACKGROUND = '#3875d7'
+    SELECT_FOREGROUND = 'white'
+    PADDING = 2
+
+    def __init__(self, master, selectmode=tk.BROWSE, font=None, yscrollcommand=None, image_size=None,
+                 on_view=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.selectmode = selectmode
+        self.yscrollcommand = yscrollcommand
+        self.font = font or tkfont.nametofont('TkDefaultFont')
+        self.image_size = image_size
+        self.on_view = on_view
+        line_height = self.font.metrics('linespace')
+        self.row_height = max(line_height, image_size[1] if image_size else 0) + self.PADDING
+
+        self.items = []
+        self.selected = set()
+        self.anchor = None
+        self.offset = 0  # Pixels scrolled from the top
+        self.pool = []   # (background rect, text, image) canvas items
+        self.images = {}  # Row index -> PhotoImage, only rows near the view
+        self.view = None  # (first, last) rows drawn last time
+        self.redraw_pending = False
+
+        self.canvas = tk.Canvas(self, background=self.BACKGROUND, highlightthickness=1,
+                                borderwidth=0, takefocus=1, width=200, height=160)
+        self.canvas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.canvas.bind('<Configure>', lambda e: self._schedule_redraw())
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<Shift-Button-1>', self._on_shift_click)
+        self.canvas.bind('<Control-Button-1>', self._on_control_click)
+        self.canvas.bind('<B1-Motion>', self._on_drag)
+        self.canvas.bind('<MouseWheel>', self._on_mousewheel)
+        self.canvas.bind('<Button-4>', lambda e: self.yview('scroll', -3, 'units'))
+        self.canvas.bind('<Button-5>', lambda e: self.yview('scroll', 3, 'units'))
+        self.canvas.bind('<Up>', lambda e: self._move_selection(-1))
+        self.canvas.bind('<Down>', lambda e: self._move_selection(1))
+        self.canvas.bind('<Prior>', lambda e: self.yview('scroll', -1, 'pages'))
+        self.canvas.bind('<Next>', lambda e: self.yview('scroll', 1, 'pages'))
+
+    def configure(self, cnf=None, **kwargs):
+        if 'yscrollcommand' in kwargs:
+            self.yscrollcommand = kwargs.pop('yscrollcommand')
+            self._schedule_redraw()
+        if cnf or kwargs:
+            return super().configure(cnf, **kwargs)
+
+    config = configure
+
+    # Content
+
+    def size(self):
+        return len(self.items)
+
+    def extend(self, rows):
+        """Append rows, only a redraw of the visible area follows"""
+        self.items.extend(rows)
+        self._schedule_redraw()
+
+    def clear(self):
+        self.items = []
+        self.images = {}
+        self.view = None
+        self.selected = set()
+        self.anchor = None
+        self.offset = 0
+        self._schedule_redraw()
+
+    def get(self, index):
+        return self.items[index]
+
+    def set_image(self, index, image):
+        """Show an image in a row's image column, ignored for rows far from the view"""
+        first, last = self.view or (0, 0)
+        margin = last - first
+        if first - margin <= index < last + margin:
+            self.images[index] = image
+            if first <= index < last:
+                self._schedule_redraw()
+
+    def has_image(self, index):
+        return index in self.images
+
+    # Selection
+
+    def curselection(self):
+        return tuple(sorted(self.selected))
+
+    def selection_set(self, first, last=None):
+        last = first if last is None else last
+        self.selected.update(range(first, last + 1))
+        self._schedule_redraw()
+
+    def selection_clear(self):
+        self.selected.clear()
+        self._schedule_redraw()
+
+    def _select(self, indexes, replace=True):
+        if replace:
+            self.selected = set(indexes)
+        else:
+            self.selected.symmetric_difference_update(indexes)
+        self._schedule_redraw()
+        self.event_generate('<<ListboxSelect>>')
+
+    def _index_at(self, y):
+        index = int((self.offset + y) // self.row_height)
+        return index if 0 <= index < len(self.items) else None
+
+    def _on_click(self, event):
+        self.canvas.focus_set()
+        index = self._index_at(event.y)
+        if index is None:
+            return
+        self.anchor = index
+        self._select([index])
+
+    def _on_shift_click(self, event):
+        index = self._index_at(event.y)
+        if index is None or self.selectmode != tk.EXTENDED or self.anchor is None:
+            return self._on_click(event)
+        first, last = sorted((self.anchor, index))
+        self._select(range(first, last + 1))
+
+    def _on_control_click(self, event):
+        index = self._index_at(event.y)
+        if index is None or self.selectmode != tk.EXTENDED:
+            return self._on_click(event)
+        self.anchor = index
+        self._select([index], replace=False)
+
+    def _on_drag(self, event):
+        if self.selectmode != tk.EXTENDED or self.anchor is None:
+            return
+        y = min(max(event.y, 0), self.canvas.winfo_height() - 1)
+        index = self._index_at(y)
+        if index is not None:
+            first, last = sorted((self.anchor, index))
+            self._select(range(first, last + 1))
+
+    def _move_selection(self, step):
+        if not self.items:
+            return
+        current = self.anchor if self.anchor is not None else -1
+        index = min(max(current + step, 0), len(self.items) - 1)
+        self.anchor = index
+        self.see(index)
+        self._select([index])
+
+    # Scrolling
+
+    def _content_height(self):
+        return len(self.items) * self.row_height
+
+    def _clamp_offset(self, offset):
+        max_offset = max(0, self._content_height() - self.canvas.winfo_height())
+        return int(min(max(offset, 0), max_offset))
+
+    def yview(self, *args):
+        """Scrollbar protocol: ('moveto', fraction) or ('scroll', n, 'units'/'pages')"""
+        if not args:
+            return self._fractions()
+
+        if args[0] == 'moveto':
+            offset = float(args[1]) * self._content_height()
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            step = self.row_height if args[2] == 'units' else max(self.row_height, self.canvas.winfo_height())
+            offset = self.offset + amount * step
+        else:
+            return
+
+        self.offset = self._clamp_offset(offset)
+        self._schedule_redraw()
+
+    def see(self, index):
+        top = index * self.row_height
+        height = self.canvas.winfo_height()
+        if top < self.offset:
+            self.offset = self._clamp_offset(top)
+        elif top + self.row_height > self.offset + height:
+            self.offset = self._clamp_offset(top + self.row_height - height)
+        self._schedule_redraw()
+
+    def _on_mousewheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.yview('scroll', -delta * 3, 'units')
+
+    def _fractions(self):
+        total = self._content_height()
+        if not total:
+            return 0.0, 1.0
+        height = self.canvas.winfo_height()
+        return self.offset / total, min(1.0, (self.offset + height) / total)
+
+    # Drawing
+
+    def _schedule_redraw(self):
+        # Bursts of changes share one redraw
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self._redraw)
+
+    def _redraw(self):
+        self.redraw_pending = False
+        self.offset = self._clamp_offset(self.offset)
+
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        first = self.offset // self.row_height
+        visible = min(len(self.items) - first, height // self.row_height + 2)
+
+        # Grow the item pool to what the view needs, never to the row count
+        while len(self.pool) < visible:
+            rect = self.canvas.create_rectangle(0, 0, 0, 0, width=0)
+            text = self.canvas.create_text(0, 0, anchor=tk.W if self.image_size else tk.NW, font=self.font)
+            image = self.canvas.create_image(0, 0, anchor=tk.NW) if self.image_size else None
+            self.pool.append((rect, text, image))
+
+        text_x = 3 + (self.image_size[0] + 6 if self.image_size else 0)
+        for slot, (rect, text, image) in enumerate(self.pool):
+            if slot >= visible:
+                for item in (rect, text, image):
+                    if item is not None:
+                        self.canvas.itemconfigure(item, state=tk.HIDDEN)
+                continue
+
+            index = first + slot
+            y = index * self.row_height - self.offset
+            selected = index in self.selected
+            self.canvas.coords(rect, 0, y, width, y + self.row_height)
+            self.canvas.itemconfigure(rect, state=tk.NORMAL,
+                                      fill=self.SELECT_BACKGROUND if selected else self.BACKGROUND)
+            if image is None:
+                self.canvas.coords(text, text_x, y + self.PADDING // 2)
+            else:
+                self.canvas.coords(text, text_x, y + self.row_height // 2)
+                self.canvas.coords(image, 3, y + self.PADDING // 2)
+                self.canvas.itemconfigure(image, state=tk.NORMAL, image=self.images.get(index, ''))
+            self.canvas.itemconfigure(text, state=tk.NORMAL, text=self.items[index],
+                                      fill=self.SELECT_FOREGROUND if selected else self.FOREGROUND)
+
+        if self.yscrollcommand:
+            self.yscrollcommand(*self._fractions())
+
+        view = (first, first + max(visible, 0))
+        if view != self.view:
+            self.view = view
+            if self.images:
+                # Keep a screenful either side, farther images are reloaded from the caller's cache
+                margin = view[1] - view[0]
+                self.images = {index: image for index, image in self.images.items()
+                               if view[0] - margin <= index < view[1] + margin}
+            if self.on_view:
+                self.on_view(*view)